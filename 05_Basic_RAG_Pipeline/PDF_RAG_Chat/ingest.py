@@ -1,22 +1,110 @@
-def ingest_pdf_to_qdrant(pdf_path, collection_name, embedding):
+import json
+from pathlib import Path
+
+# Version of every ingested collection ({ collection: n }) - bumped on each (re-)ingest, so the semantic cache
+# in main.py never serves chunks or answers from before a re-ingest
+VERSIONS_FILE = Path(__file__).parent / "collection_versions.json"
+
+def collection_version(collection_name):
+    versions = json.loads(VERSIONS_FILE.read_text()) if VERSIONS_FILE.exists() else {}
+    return versions.get(collection_name, 0)
+
+def bump_collection_version(collection_name):
+    versions = json.loads(VERSIONS_FILE.read_text()) if VERSIONS_FILE.exists() else {}
+    versions[collection_name] = versions.get(collection_name, 0) + 1
+    VERSIONS_FILE.write_text(json.dumps(versions, indent=2))
+
+# Peak resident memory (RSS) of this process in MB - None if the platform can't report it
+def peak_rss_mb():
+    import sys
+
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # macOS reports bytes, Linux reports KB
+    except ImportError:
+        pass
+
+    try:
+        import psutil # Windows has no 'resource' module
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+def ingest_pdf_to_qdrant(pdf_path, collection_name, embedding, streaming=True, window_size=64):
+    import os
+    import time
     from langchain_community.document_loaders import PyPDFLoader
     from langchain_text_splitters import RecursiveCharacterTextSplitter
-    from langchain_qdrant import QdrantVectorStore
 
     loader = PyPDFLoader(file_path=pdf_path)
-    docs = loader.load()
 
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200
     )
-    chunks = text_splitter.split_documents(docs)
 
-    vector_store = QdrantVectorStore.from_documents(
-        documents=[],
-        url="http://localhost:6333",
-        collection_name=collection_name,
-        embedding=embedding
-    )
-    vector_store.add_documents(documents=chunks)
-    print("Ingestion complete.")
+    # VECTOR_BACKEND=local (or local-hnsw) -> in-process index under ./local_index, no Qdrant container needed
+    backend = os.getenv("VECTOR_BACKEND", "qdrant")
+    if backend in ("local", "local-hnsw"):
+        import uuid
+        from local_index import LocalVectorIndex
+
+        index = LocalVectorIndex(collection_name, dtype=os.getenv("LOCAL_INDEX_DTYPE", "float32"), hnsw=backend == "local-hnsw")
+
+        def add_documents(documents):
+            vectors = embedding.embed_documents([doc.page_content for doc in documents])
+            index.upsert(
+                [str(uuid.uuid4()) for _ in documents],
+                vectors,
+                [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents] # same layout as QdrantVectorStore
+            )
+    else:
+        from langchain_qdrant import QdrantVectorStore
+
+        vector_store = QdrantVectorStore.from_documents(
+            documents=[],
+            url="http://localhost:6333",
+            collection_name=collection_name,
+            embedding=embedding
+        )
+
+        def add_documents(documents):
+            vector_store.add_documents(documents=documents)
+
+    start = time.perf_counter()
+    n_pages = 0
+    n_chunks = 0
+
+    if not streaming:
+        # Load everything -> split everything -> embed + upsert everything (whole PDF in memory)
+        docs = loader.load()
+        chunks = text_splitter.split_documents(docs)
+        add_documents(chunks)
+        n_pages, n_chunks = len(docs), len(chunks)
+    else:
+        # Streaming: page -> chunks -> embed -> upsert in fixed-size windows,
+        # so peak memory stays flat no matter how many pages the PDF has
+        window = []
+        for page in loader.lazy_load():
+            n_pages += 1
+            window.extend(text_splitter.split_documents([page]))
+
+            if len(window) >= window_size:
+                add_documents(window)
+                n_chunks += len(window)
+                window = []
+
+        if window:
+            add_documents(window)
+            n_chunks += len(window)
+
+    bump_collection_version(collection_name)
+
+    elapsed = time.perf_counter() - start
+    pages_per_sec = n_pages / elapsed if elapsed else 0.0
+    peak_rss = peak_rss_mb()
+
+    rss = f"{peak_rss:.1f} MB" if peak_rss is not None else "n/a"
+    print(f"Ingestion complete. {n_pages} pages, {n_chunks} chunks in {elapsed:.1f}s "
+          f"({pages_per_sec:.2f} pages/sec, peak RSS {rss})")
@@ -2,11 +2,13 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 import json
+import atexit
 from google import genai
 from google.genai import types
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from ingest import ingest_pdf_to_qdrant
+from ingest import ingest_pdf_to_qdrant, collection_version
 from retrieve import retrieve_relevant_chunks
+from semantic_cache import SemanticCache
 
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
@@ -31,6 +33,10 @@ print("This PDF is already ingested")
 def get_relevant_chunks(user_query):
     return retrieve_relevant_chunks(user_query, embedding, collection_name)
 
+# Semantic cache - paraphrased questions reuse the chunks (or the whole answer) of a question asked before
+semantic_cache = SemanticCache(embedding, collection_name, answer_threshold=0.95, chunks_threshold=0.90)
+atexit.register(semantic_cache.report) # print semantic cache hits/misses when the script exits
+
 system_instructions = """
 <goal>
 You're an intelligent AI assistant.
@@ -97,6 +103,17 @@ Assistant: { "step": "output", "content": "suitable answer for query" }
 # To store conversation
 contents = []
 
+# Append a step to the conversation as the model's turn
+def add_model_step(step):
+    contents.append(
+        types.Content(
+            role = "model",
+            parts = [
+                types.Part.from_text(text=json.dumps(step))
+            ]
+        )
+    )
+
 # Take input from user
 def user_input(input_param = "Ask Anything -> "):
     query = input(input_param)
@@ -118,6 +135,25 @@ def user_input(input_param = "Ask Anything -> "):
 while True: 
     user_input("Ask anything on your PDF -> ")
 
+    # Semantic cache lookup for the new question - only the first question of the conversation is self-contained,
+    # a follow-up ("and the second one?") means something else after different earlier turns
+    question = contents[-1].parts[0].text
+    standalone = len(contents) == 1
+    version = collection_version(collection_name)
+    cached = semantic_cache.lookup(question, version) if standalone else None
+    if cached and cached["answer"]:
+        print(f"♻️ Answered a similar question before ({cached['similarity']:.2f} similar): '{cached['query']}'\n")
+        print(f"--🤖: FINAL ANSWER--\n{cached['answer']}\n")
+        add_model_step({"step": "output", "content": cached["answer"]})
+        continue
+
+    turn_chunks = None # chunks retrieved for this question (only answers grounded in chunks are cached)
+    asked_follow_up = False # answers that depend on a clarification are not cached
+    if cached:
+        print(f"♻️ Reusing chunks retrieved for a similar question ({cached['similarity']:.2f} similar): '{cached['query']}'\n")
+        turn_chunks = cached["chunks"]
+        add_model_step({"step": "observe", "chunks": turn_chunks})
+
     while True:
         response = client.models.generate_content(
             model = "gemini-2.0-flash",
@@ -152,6 +188,7 @@ while True:
             print(parsed_response.get("content"))
             formatted_input = parsed_response.get("input", "") + " -> "
             user_input(formatted_input)
+            asked_follow_up = True
             continue
 
         if step == "action":
@@ -164,6 +201,7 @@ while True:
                 print("🔁 Retrieving chunks from vector database\n")
 
                 output = get_relevant_chunks(tool_input)
+                turn_chunks = output
 
                 print("Retrieved Chunks ------------")
                 for chunk in output:
@@ -189,4 +227,6 @@ while True:
 
         # Final Answer
         print(f"--🤖: FINAL ANSWER--\n{parsed_response["content"]}\n")
+        if standalone and turn_chunks is not None and not asked_follow_up:
+            semantic_cache.store(question, turn_chunks, parsed_response["content"], version)
         break 
@@ -1,11 +1,45 @@
+import threading
+
+# Process-wide vector store registry - one store (and one pooled client) per (backend, url, collection, embedding),
+# reused by every query instead of reconnecting and re-fetching the collection info each time
+_vector_stores = {}
+_vector_stores_lock = threading.Lock()
+
+def get_vector_store(collection_name, embedding, backend="qdrant", url="http://localhost:6333"):
+    key = (backend, url, collection_name, id(embedding))
+    with _vector_stores_lock:
+        if key not in _vector_stores:
+            if backend in ("local", "local-hnsw"):
+                from local_index import LocalVectorIndex
+                store = LocalVectorIndex(collection_name, hnsw=backend == "local-hnsw")
+            else:
+                from langchain_qdrant import QdrantVectorStore
+                store = QdrantVectorStore.from_existing_collection(
+                    url=url,
+                    collection_name=collection_name,
+                    embedding=embedding
+                )
+            _vector_stores[key] = (store, embedding) # keep the embedding alive so its id() can't be reused
+        return _vector_stores[key][0]
+
 def retrieve_relevant_chunks(user_query, embedding, collection_name):
-    from langchain_qdrant import QdrantVectorStore
+    import os
+
+    # VECTOR_BACKEND=local (or local-hnsw) -> search the in-process index written by ingest.py
+    backend = os.getenv("VECTOR_BACKEND", "qdrant")
+    if backend in ("local", "local-hnsw"):
+        index = get_vector_store(collection_name, embedding, backend)
+        final_result = []
+        for result in index.search(embedding.embed_query(user_query), k=3):
+            metadata = result["payload"].get("metadata") or {}
+            final_result.append({
+                "content": result["payload"].get("page_content", ""),
+                "page_num": metadata.get("page", ""),
+                "total_pages": metadata.get("total_pages", "")
+            })
+        return final_result
 
-    vector_store = QdrantVectorStore.from_existing_collection(
-        url="http://localhost:6333",
-        collection_name=collection_name,
-        embedding=embedding
-    )
+    vector_store = get_vector_store(collection_name, embedding)
 
     results = vector_store.similarity_search(user_query, k=3)
 
@@ -0,0 +1,109 @@
+import time
+import uuid
+from pathlib import Path
+from local_index import LocalVectorIndex
+
+# Semantic cache of past questions - catches paraphrases ("what is reach?" vs "define reach") that an exact-match cache misses.
+# Every answered question is stored with its embedding, the retrieved chunks and the final answer in a small local
+# vector index (semantic_cache/<namespace>/). A new question is embedded once and compared with the past ones:
+#   similarity >= answer_threshold -> reuse the final answer (no LLM call, no vector search)
+#   similarity >= chunks_threshold -> reuse the retrieved chunks (skips query generation + vector search)
+# Entries of an older collection version (re-ingested PDF) or older than ttl_seconds are dropped on lookup.
+
+CACHE_ROOT = Path(__file__).parent / "semantic_cache"
+
+class SemanticCache:
+    def __init__(self, embedding, namespace, answer_threshold=0.95, chunks_threshold=0.90, ttl_seconds=7 * 24 * 3600, max_entries=1000, root=CACHE_ROOT):
+        self.embedding = embedding
+        self.namespace = namespace
+        self.answer_threshold = answer_threshold
+        self.chunks_threshold = chunks_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.index = LocalVectorIndex(namespace, root=root)
+        self._vectors = {} # normalized question -> embedding (lookup + store embed a question only once)
+
+        # Stats
+        self.answer_hits = 0
+        self.chunk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query):
+        return " ".join(query.lower().split())
+
+    def _remember(self, key, vector):
+        if len(self._vectors) >= 256:
+            self._vectors.clear()
+        self._vectors[key] = vector
+        return vector
+
+    def _vector(self, query):
+        key = self.normalize(query)
+        if key not in self._vectors:
+            return self._remember(key, self.embedding.embed_query(query))
+        return self._vectors[key]
+
+    # Async callers embed the question on the event loop first - lookup() and store() then reuse the vector
+    async def aembed(self, query):
+        key = self.normalize(query)
+        if key not in self._vectors:
+            return self._remember(key, await self.embedding.aembed_query(query))
+        return self._vectors[key]
+
+    def _point_id(self, query):
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.namespace}:{self.normalize(query)}"))
+
+    # Best reusable entry -> { "query", "similarity", "chunks", "answer" (None for a chunks-only hit) } or None
+    def lookup(self, query, version=0):
+        hits = self.index.search(self._vector(query), k=5) if self.index.count() else []
+        now = time.time()
+        expired = []
+        result = None
+
+        for hit in hits:
+            entry = hit["payload"]
+            if entry["version"] != version or now - entry["created_at"] > self.ttl_seconds:
+                expired.append(hit["id"])
+                continue
+            if hit["score"] < self.chunks_threshold:
+                break # hits are sorted by similarity
+            result = {"query": entry["query"], "similarity": hit["score"], "chunks": entry["chunks"], "answer": None}
+            if hit["score"] >= self.answer_threshold and entry["answer"]:
+                result["answer"] = entry["answer"]
+            break
+
+        self.index.delete(expired)
+        if result is None:
+            self.misses += 1
+        elif result["answer"]:
+            self.answer_hits += 1
+        else:
+            self.chunk_hits += 1
+        return result
+
+    # Remember the chunks and final answer of an answered question (the same question again overwrites it)
+    def store(self, query, chunks, answer=None, version=0):
+        payload = {"query": query, "chunks": chunks, "answer": answer, "version": version, "created_at": time.time()}
+        self.index.upsert([self._point_id(query)], [self._vector(query)], [payload])
+
+        # Size cap - drop the oldest questions
+        points = self.index.points()
+        if len(points) > self.max_entries:
+            points.sort(key=lambda point: point[1]["created_at"])
+            self.index.delete([point_id for point_id, _ in points[:len(points) - self.max_entries]])
+
+    def stats(self):
+        total = self.answer_hits + self.chunk_hits + self.misses
+        return {
+            "answer_hits": self.answer_hits,
+            "chunk_hits": self.chunk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.answer_hits + self.chunk_hits) / total if total else 0.0,
+            "entries": self.index.count(),
+        }
+
+    def report(self):
+        s = self.stats()
+        print(f"🧠 Semantic cache: {s['answer_hits']} answers + {s['chunk_hits']} chunk sets reused / {s['misses']} misses "
+              f"({s['hit_ratio']:.0%} hit ratio), {s['entries']} cached questions")
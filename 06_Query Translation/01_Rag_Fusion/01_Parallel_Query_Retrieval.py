@@ -13,13 +13,17 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 import json
+import atexit
 import asyncio
 from google import genai
 from google.genai import types
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from gemini_embeddings import GeminiEmbeddings
+from embedding_cache import CachedEmbeddings
 from ingest import ingest_pdf_to_qdrant
 from ingest import should_ingest
-from retrieve import parallel_query_retrieval
+from retrieve import parallel_query_retrieval, async_retrieve_chunks, retrieval_cache, collection_version
+from semantic_cache import SemanticCache
+from context_packer import ContextPacker
 
 # Load Environmental Variables
 load_dotenv()
@@ -30,11 +34,13 @@ client = genai.Client(
     api_key=api_key,
 )
 
-# Embedder - Embedding Model
-embedding = GoogleGenerativeAIEmbeddings(
+# Embedder - Embedding Model (wrapped in a persistent on-disk cache shared by ingestion and retrieval)
+embedding = CachedEmbeddings(GeminiEmbeddings(
     model="models/text-embedding-004",
     google_api_key=api_key,
-)
+))
+atexit.register(embedding.report) # print cache hits/misses when the script exits
+atexit.register(retrieval_cache.report) # print retrieval cache hits/misses too
 
 # Ingestion
 pdf_path = Path(__file__).parent / "../data/Atomic Habits.pdf"
@@ -47,10 +53,16 @@ else:
     # use the existing collection_name as-is, and skip re-ingesting
     pass
 
+# Semantic cache - paraphrased questions reuse the chunks (or the whole answer) of a question asked before
+semantic_cache = SemanticCache(embedding, collection_name, answer_threshold=0.95, chunks_threshold=0.90)
+atexit.register(semantic_cache.report)
+
 # Retrieval
 n_queries = 3 # number of queries to generate (default)
 max_chunks = 10 # number of chunks to retrieve for each query from DB
 generated_queries = [] # to store all generated queries
+context_packer = ContextPacker(max_tokens=3000) # token budget for the retrieved chunks of one turn
+speculative_retrieval = True # retrieve the user's question while the LLM generates the sub-queries
 
 # System Instructions 
 system_instructions = f"""
@@ -159,12 +171,52 @@ def user_input(input_param = "Ask Anything -> "):
         )
     )
 
+# Append a step to the conversation as the model's turn
+def add_model_step(step):
+    contents.append(
+        types.Content(
+            role="model",
+            parts=[
+                types.Part.from_text(text=json.dumps(step))
+            ]
+        )
+    )
+
 async def main():
     while True: 
         user_input("Ask anything on your PDF -> ")
 
+        # Semantic cache lookup for the new question - only the first question of the conversation is self-contained,
+        # a follow-up ("and the second one?") means something else after different earlier turns
+        question = contents[-1].parts[0].text
+        standalone = len(contents) == 1
+        version = collection_version(collection_name)
+        cached = None
+        if standalone:
+            await semantic_cache.aembed(question) # embedded on the event loop, lookup/store reuse the vector
+            cached = semantic_cache.lookup(question, version)
+        if cached and cached["answer"]:
+            print(f"♻️ Answered a similar question before ({cached['similarity']:.2f} similar): '{cached['query']}'\n")
+            print("🤖 FINAL ANSWER: \n", cached["answer"], "\n")
+            add_model_step({"step": "final_answer", "answer": cached["answer"]})
+            continue
+
+        turn_chunks = None # chunks retrieved for this question (only answers grounded in chunks are cached)
+        asked_follow_up = False # answers that depend on a clarification are not cached
+        if cached:
+            print(f"♻️ Reusing chunks retrieved for a similar question ({cached['similarity']:.2f} similar): '{cached['query']}'\n")
+            turn_chunks = cached["chunks"]
+            add_model_step({"step": "retrieved_chunks", "chunks": turn_chunks})
+
+        # Speculative retrieval - starts now and runs during the query-generation call below,
+        # so by the time the generated queries arrive the question's own search is (mostly) done
+        prefetched = None
+        if speculative_retrieval and not cached:
+            prefetched = {question: asyncio.create_task(async_retrieve_chunks(question, max_chunks, embedding, collection_name))}
+
         while True:
-            response = client.models.generate_content(
+            # client.aio - the request is awaited instead of blocking the event loop
+            response = await client.aio.models.generate_content(
                 model = "gemini-2.0-flash",
                 config = types.GenerateContentConfig(
                     system_instruction = system_instructions,
@@ -199,6 +251,7 @@ async def main():
             if step == "ask":
                 print("FOLLOW UP QUESTION: ", parsed_response.get("content"))
                 user_input("Your Response -> ")
+                asked_follow_up = True
                 continue
 
             if step == "generated_queries":
@@ -210,7 +263,14 @@ async def main():
                 generated_queries.extend(queries) # extend - takes every item from queries and appends it to generated_queries
 
                 print("\n🔁 Retrieving chunks for generated queries...\n")
-                retrieved_chunks = await parallel_query_retrieval(generated_queries, max_chunks, embedding, collection_name)
+                retrieved_chunks = await parallel_query_retrieval(generated_queries, max_chunks, embedding, collection_name, prefetched=prefetched)
+                prefetched = None # the generated queries of a later round start from scratch
+
+                # Best-ranked chunks within the token budget, neighbours from the same page merged
+                packed_chunks = context_packer.pack(retrieved_chunks)
+                context_packer.report(retrieved_chunks, packed_chunks)
+                retrieved_chunks = packed_chunks
+                turn_chunks = retrieved_chunks
 
                 contents.append(
                     types.Content(
@@ -229,6 +289,11 @@ async def main():
 
             if step == "final_answer":
                 print("🤖 FINAL ANSWER: \n", parsed_response.get("answer"), "\n")
+                if standalone and turn_chunks is not None and not asked_follow_up:
+                    semantic_cache.store(question, turn_chunks, parsed_response.get("answer"), version)
+                if prefetched: # answered without generating queries - drop the speculative search
+                    for task in prefetched.values():
+                        task.cancel()
                 break
                 
 
@@ -0,0 +1,160 @@
+import re
+import math
+import json
+import heapq
+import sqlite3
+import threading
+from pathlib import Path
+from collections import Counter
+from rrf import rrf_top
+
+# Sparse keyword index (BM25) - catches exact terms dense embeddings blur: chapter names, acronyms, numbers.
+# One SQLite file per collection (bm25_index/<collection>.db) holding an inverted index:
+#   docs     -> id, length (tokens), payload ({ "page_content", "metadata" } like the vector points)
+#   postings -> (term, doc id, term frequency), clustered by term (WITHOUT ROWID) so a query term is one range scan
+# Point ids are the same as in the vector store, so sparse and dense hits of the same chunk can be fused by id.
+
+INDEX_ROOT = Path(__file__).parent / "bm25_index"
+
+# Lower-cased words and numbers - no stemming, so "GDPR" or "4.2" only match themselves
+def tokenize(text):
+    return re.findall(r"\w+(?:\.\d+)*", text.lower())
+
+class BM25Index:
+    def __init__(self, collection_name, root=INDEX_ROOT, k1=1.2, b=0.75):
+        self.collection_name = collection_name
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+
+        path = Path(root) / f"{collection_name}.db"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY,
+                length INTEGER NOT NULL,
+                payload TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_doc_id ON postings (doc_id);
+        """)
+        self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def ids(self):
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT id FROM docs")}
+
+    def _delete(self, ids):
+        for i in range(0, len(ids), 500): # stay under SQLite's bound-parameter limit
+            part = ids[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            self._conn.execute(f"DELETE FROM postings WHERE doc_id IN ({placeholders})", part)
+            self._conn.execute(f"DELETE FROM docs WHERE id IN ({placeholders})", part)
+
+    # Same id again replaces the old document
+    def add(self, ids, payloads):
+        docs = []
+        postings = []
+        for point_id, payload in zip(ids, payloads):
+            terms = Counter(tokenize(payload["page_content"]))
+            docs.append((point_id, sum(terms.values()), json.dumps(payload)))
+            postings.extend((term, point_id, tf) for term, tf in terms.items())
+
+        with self._lock:
+            self._delete(list(ids))
+            self._conn.executemany("INSERT INTO docs (id, length, payload) VALUES (?, ?, ?)", docs)
+            self._conn.executemany("INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)", postings)
+            self._conn.commit()
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            self._delete(list(ids))
+            self._conn.commit()
+
+    # Top-k documents by BM25 score -> [{ "id", "score", "payload" }, ...] (same shape as vector search hits)
+    def search(self, query, k):
+        terms = list(set(tokenize(query)))
+        if not terms:
+            return []
+
+        placeholders = ",".join("?" * len(terms))
+        with self._lock:
+            n_docs, total_length = self._conn.execute("SELECT COUNT(*), SUM(length) FROM docs").fetchone()
+            rows = self._conn.execute(
+                f"SELECT p.term, p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc_id WHERE p.term IN ({placeholders})",
+                terms
+            ).fetchall()
+        if not n_docs:
+            return []
+
+        # Document frequency of each query term = number of postings fetched for it
+        df = Counter(term for term, _, _, _ in rows)
+        average_length = total_length / n_docs
+
+        scores = {}
+        for term, doc_id, tf, length in rows:
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / average_length))
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        if not top:
+            return []
+
+        top_ids = [doc_id for doc_id, _ in top]
+        with self._lock:
+            payloads = dict(self._conn.execute(
+                f"SELECT id, payload FROM docs WHERE id IN ({','.join('?' * len(top_ids))})", top_ids
+            ).fetchall())
+        return [{"id": doc_id, "score": score, "payload": json.loads(payloads[doc_id])} for doc_id, score in top if doc_id in payloads]
+
+    def search_batch(self, queries, k):
+        return [self.search(query, k) for query in queries]
+
+# Fuse dense and sparse hits of one query with Reciprocal Rank Fusion (the same rrf_top as fuse_rankings in retrieve.py).
+# Returns hits in the usual { "id", "score", "payload" } shape, where score is the fused RRF score.
+def fuse_hits(dense_hits, sparse_hits, limit, k=60):
+    top = rrf_top((dense_hits, sparse_hits), lambda hit: hit["id"], k, top_k=limit)
+    return [{**hit, "score": score} for score, hit in top]
+
+# One index (and SQLite connection) per collection per process
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_bm25_index(collection_name):
+    with _indexes_lock:
+        if collection_name not in _indexes:
+            _indexes[collection_name] = BM25Index(collection_name)
+        return _indexes[collection_name]
+
+
+# (Re)build the keyword index of a collection that was ingested before ingestion built one, from its vector store:
+# python bm25_index.py <collection_name>
+if __name__ == "__main__":
+    import argparse
+    from vector_backends import get_vector_backend
+
+    parser = argparse.ArgumentParser(description="Build the BM25 keyword index of an ingested collection")
+    parser.add_argument("collection_name")
+    args = parser.parse_args()
+
+    points = get_vector_backend(args.collection_name).points()
+    index = get_bm25_index(args.collection_name)
+    index.delete(list(index.ids() - {point_id for point_id, _ in points}))
+    for i in range(0, len(points), 500):
+        batch = points[i:i + 500]
+        index.add([point_id for point_id, _ in batch], [payload for _, payload in batch])
+    print(f"✅ Indexed {len(points)} chunks of '{args.collection_name}' for keyword search")
@@ -0,0 +1,75 @@
+import tiktoken
+
+# Fits retrieved chunks into a token budget before they are put into the prompt.
+# Without it every retrieved chunk goes in - (n_queries + 1) x max_chunks chunks of ~1000 characters per turn.
+#   1. chunks are taken best-ranked first (the order retrieval returns them in) until the budget is used up
+#   2. chunks of the same page that overlap or touch (chunk_overlap) are merged, so the shared text is sent once
+#   3. the chunk that crosses the budget is trimmed (if enough of it fits to be useful)
+#   4. only { "page", "text" } is kept - ids, scores and total_pages don't help the LLM answer
+# Note: tiktoken is OpenAI's tokenizer, so for Gemini the budget is a close estimate, not exact.
+class ContextPacker:
+    def __init__(self, max_tokens=3000, encoding_name="o200k_base", min_trim_tokens=64):
+        self.max_tokens = max_tokens
+        self.min_trim_tokens = min_trim_tokens
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    # Spans [(start, text), ...] of one page sorted by position -> merged texts.
+    # Spans without a start_index (older caches) can't be placed on the page and stay separate, and so do spans
+    # whose overlapping text doesn't match - a chunk reused after its page was edited keeps its old start_index.
+    @staticmethod
+    def _merge_spans(spans):
+        placed = sorted((span for span in spans if span[0] is not None), key=lambda span: span[0])
+        merged = [] # [start, end, text]
+        separate = [text for start, text in spans if start is None]
+        for start, text in placed:
+            end = start + len(text)
+            last = merged[-1] if merged else None
+            if last is None or start > last[1] + 2: # +2: only the whitespace the splitter trimmed between them
+                merged.append([start, end, text])
+                continue
+
+            shared = min(end, last[1]) - start # characters both spans claim to cover
+            offset = start - last[0]
+            if shared > 0 and last[2][offset:offset + shared] != text[:shared]:
+                separate.append(text)
+                continue
+            if end > last[1]:
+                last[2] += text[shared:] if shared >= 0 else " " + text
+                last[1] = end
+        return [text for _, _, text in merged] + separate
+
+    # Best-ranked chunks -> [{ "page", "text" }, ...] within max_tokens (pages in the order of their best chunk)
+    def pack(self, chunks):
+        pages = {} # page -> [(start_index, content), ...]
+        page_tokens = {} # page -> tokens of its merged texts
+        used = 0
+
+        for chunk in chunks:
+            content = chunk.get("content")
+            if not content:
+                continue
+            page = chunk.get("page_num")
+            spans = pages.get(page, []) + [(chunk.get("start_index"), content)]
+            tokens = sum(self.count_tokens(text) for text in self._merge_spans(spans))
+            extra = tokens - page_tokens.get(page, 0) # overlap with chunks already packed costs nothing
+
+            if used + extra > self.max_tokens:
+                remaining = self.max_tokens - used
+                if remaining >= self.min_trim_tokens:
+                    trimmed = self.encoding.decode(self.encoding.encode(content, disallowed_special=())[:remaining])
+                    pages.setdefault(page, []).append((None, trimmed)) # no longer the full span - never merged
+                break
+
+            pages[page] = spans
+            page_tokens[page] = tokens
+            used += extra
+
+        return [{"page": page, "text": text} for page, spans in pages.items() for text in self._merge_spans(spans)]
+
+    def report(self, chunks, packed):
+        before = sum(self.count_tokens(chunk.get("content") or "") for chunk in chunks)
+        after = sum(self.count_tokens(item["text"]) for item in packed)
+        print(f"📦 Packed {len(chunks)} chunks into {len(packed)} passages: ~{before} -> ~{after} tokens (budget {self.max_tokens})\n")
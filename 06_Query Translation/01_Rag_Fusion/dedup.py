@@ -0,0 +1,82 @@
+import re
+import hashlib
+import numpy as np
+
+# Near-duplicate chunk filter (MinHash + LSH banding)
+# Chunks are turned into sets of word shingles; a MinHash signature estimates the Jaccard similarity of two sets,
+# and LSH buckets (bands of the signature) find candidate pairs without comparing every chunk with every other chunk.
+# A chunk whose estimated similarity to an already kept chunk is >= threshold is dropped before it gets embedded.
+
+PRIME = 4294967311 # smallest prime > 2**32, so (a * h + b) never overflows uint64 for 32-bit a, b, h
+
+class NearDuplicateFilter:
+    def __init__(self, threshold=0.85, num_perm=128, shingle_size=5, seed=42):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2**32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2**32, size=num_perm, dtype=np.uint64)
+
+        # Pick bands x rows so the LSH "S-curve" threshold (1/bands)^(1/rows) sits a bit below 'threshold' -
+        # pairs right at the S-curve threshold are only found half of the time, candidates are verified exactly anyway
+        lsh_threshold = max(threshold - 0.15, 0.05)
+        self.bands, self.rows = min(
+            ((bands, num_perm // bands) for bands in range(1, num_perm + 1) if num_perm % bands == 0),
+            key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - lsh_threshold)
+        )
+        self._buckets = [{} for _ in range(self.bands)] # band -> { band bytes: [signature index, ...] }
+        self._signatures = []
+        self._keys = [] # caller's key of every indexed chunk (e.g. its point id)
+
+    def _shingle_hashes(self, text):
+        words = re.findall(r"\w+", text.lower())
+        if len(words) <= self.shingle_size:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little") for shingle in shingles),
+            dtype=np.uint64, count=len(shingles)
+        )
+
+    # One vectorized pass: (num_perm x n_shingles) hash matrix -> min over shingles
+    def signature(self, text):
+        hashes = self._shingle_hashes(text)
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _index(self, signature, key=None):
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        self._keys.append(key)
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(key, []).append(index)
+
+    # Index a chunk that is kept no matter what (e.g. already in the collection)
+    def add(self, text, key=None):
+        self._index(self.signature(text), key)
+
+    # Signature index of an indexed chunk 'signature' is a near-duplicate of, or None
+    def _match(self, signature):
+        candidates = set()
+        for bucket, band_key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band_key, ()))
+
+        for index in sorted(candidates):
+            if np.mean(self._signatures[index] == signature) >= self.threshold: # estimated Jaccard similarity
+                return index
+        return None
+
+    # Key of the indexed chunk 'text' is a near-duplicate of (and 'text' is not indexed),
+    # otherwise indexes 'text' under 'key' and returns None - every chunk must be indexed with a key for this
+    def find_duplicate(self, text, key=None):
+        signature = self.signature(text)
+        index = self._match(signature)
+        if index is not None:
+            return self._keys[index]
+
+        self._index(signature, key)
+        return None
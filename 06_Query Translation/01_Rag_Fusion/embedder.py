@@ -0,0 +1,144 @@
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+
+# Errors that mean "slow down and try again" (HTTP 429 / gRPC RESOURCE_EXHAUSTED / quota messages)
+def is_rate_limit_error(error):
+    text = f"{type(error).__name__} {error}".lower()
+    markers = ("429", "resourceexhausted", "resource_exhausted", "rate limit", "ratelimit", "quota", "too many requests")
+    return any(marker in text for marker in markers)
+
+class RateLimitError(Exception):
+    pass
+
+# Local stand-in for GoogleGenerativeAIEmbeddings - deterministic vectors + simulated round-trip latency,
+# so the ingestion embedding stage can be benchmarked offline
+class FakeEmbeddings(Embeddings):
+    def __init__(self, size=768, latency=0.2, rate_limit_every=0):
+        self.model = "fake-embeddings"
+        self.size = size
+        self.latency = latency # seconds per request (one batch = one request)
+        self.rate_limit_every = rate_limit_every # raise a 429 on every n-th request (0 = never)
+        self.requests = 0
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        return [rng.uniform(-1.0, 1.0) for _ in range(self.size)]
+
+    def _count_request(self):
+        self.requests += 1
+        if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+            raise RateLimitError("429 Too Many Requests (simulated)")
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        self._count_request()
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.latency)
+        self._count_request()
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+# Wraps any LangChain Embeddings: splits texts into batches and embeds them with N concurrent async workers.
+# Rate-limit errors are retried with exponential backoff + jitter, everything else is raised immediately.
+class ConcurrentEmbedder(Embeddings):
+    def __init__(self, embedding, batch_size=64, workers=4, max_retries=6, base_delay=1.0, max_delay=60.0):
+        self.embedding = embedding
+        self.model = getattr(embedding, "model", type(embedding).__name__)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.batches = 0
+        self.retries = 0
+
+    async def _embed_batch(self, texts):
+        for attempt in range(self.max_retries + 1):
+            try:
+                vectors = await self.embedding.aembed_documents(texts)
+                self.batches += 1
+                return vectors
+            except Exception as error:
+                if not is_rate_limit_error(error) or attempt == self.max_retries:
+                    raise
+
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.retries += 1
+                print(f"⏳ Rate limited, retrying batch in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+
+    async def aembed_documents(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = [None] * len(batches)
+
+        queue = asyncio.Queue()
+        for item in enumerate(batches):
+            queue.put_nowait(item)
+
+        # each worker keeps pulling the next batch until the queue is empty
+        async def worker():
+            while not queue.empty():
+                index, batch = queue.get_nowait()
+                results[index] = await self._embed_batch(batch)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(batches)))))
+
+        # keep the original text order
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    # Sync wrapper for callers without an event loop (ingestion scripts) - async code awaits aembed_documents.
+    # A sync call made from inside a running loop can't asyncio.run on that thread, so it runs the batches
+    # on a fresh loop in a worker thread instead of raising RuntimeError.
+    def embed_documents(self, texts):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aembed_documents(texts))
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, self.aembed_documents(texts)).result()
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_query(self, text):
+        return self.embedding.embed_query(text)
+
+
+# Offline throughput benchmark against FakeEmbeddings
+# e.g. python embedder.py --texts 2000 --batch-size 64 --workers 1 2 4 8 --latency 0.2
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the concurrent embedding stage offline")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated seconds per embedding request")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="simulate a 429 on every n-th request")
+    args = parser.parse_args()
+
+    texts = [f"chunk number {i} " * 20 for i in range(args.texts)]
+
+    for workers in args.workers:
+        fake = FakeEmbeddings(latency=args.latency, rate_limit_every=args.rate_limit_every)
+        embedder = ConcurrentEmbedder(fake, batch_size=args.batch_size, workers=workers, base_delay=0.05)
+
+        start = time.perf_counter()
+        vectors = embedder.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+
+        assert len(vectors) == len(texts)
+        print(f"workers={workers:<3} batch_size={args.batch_size:<4} {len(texts) / elapsed:8.1f} texts/sec "
+              f"({embedder.batches} batches, {embedder.retries} retries, {elapsed:.2f}s)")
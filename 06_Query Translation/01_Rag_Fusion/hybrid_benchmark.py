@@ -0,0 +1,62 @@
+import time
+import random
+import argparse
+import statistics
+from collections import Counter
+from bm25_index import tokenize
+from vector_backends import get_vector_backend
+from ingest_directory import get_embedding
+from retrieve import retrieve_relevant_chunks, retrieval_cache
+
+# Dense-only vs hybrid (dense + BM25) retrieval on an ingested collection: recall@k and per-query latency.
+# Queries are generated from random chunks of the collection, the chunk they came from is the expected hit:
+#   keyword -> the 3 rarest terms of the chunk (what exact-term questions look like: names, acronyms, numbers)
+#   phrase  -> 12 consecutive words of the chunk
+# python hybrid_benchmark.py <collection_name> --queries 50 --k 10
+# python hybrid_benchmark.py <collection_name> --fake   (offline embedder - dense recall is meaningless, latency is not)
+
+def make_queries(points, n_queries, seed=0):
+    rng = random.Random(seed)
+    df = Counter(term for _, payload in points for term in set(tokenize(payload["page_content"])))
+
+    queries = {"keyword": [], "phrase": []}
+    for point_id, payload in rng.sample(points, min(n_queries, len(points))):
+        terms = tokenize(payload["page_content"])
+        if len(terms) < 12:
+            continue
+        rarest = sorted(set(terms), key=lambda term: (df[term], term))[:3]
+        queries["keyword"].append((" ".join(rarest), point_id))
+        start = rng.randrange(len(terms) - 11)
+        queries["phrase"].append((" ".join(terms[start:start + 12]), point_id))
+    return queries
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare dense-only and hybrid retrieval")
+    parser.add_argument("collection_name")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--fake", action="store_true", help="use the offline FakeEmbeddings instead of Gemini")
+    args = parser.parse_args()
+
+    embedding = get_embedding(args.fake)
+    retrieval_cache.max_entries = 0 # measure retrieval, not the result cache
+    points = get_vector_backend(args.collection_name).points()
+    queries = make_queries(points, args.queries)
+
+    print(f"{len(points)} chunks, {len(queries['keyword'])} queries per kind, recall@{args.k}\n")
+    print(f"{'queries':<10}{'mode':<8}{'recall':>8}{'median ms':>11}{'p95 ms':>9}")
+    for kind, kind_queries in queries.items():
+        if not kind_queries:
+            continue
+        for mode in ("dense", "hybrid"):
+            found = 0
+            latencies = []
+            for query, expected_id in kind_queries:
+                start = time.perf_counter()
+                results = retrieve_relevant_chunks(query, args.k, embedding, args.collection_name, score_threshold=0.0, mode=mode)
+                latencies.append(time.perf_counter() - start)
+                found += any(chunk["id"] == expected_id for chunk in results)
+
+            latencies.sort()
+            p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+            print(f"{kind:<10}{mode:<8}{found / len(kind_queries):>8.0%}{statistics.median(latencies) * 1000:>11.2f}{p95 * 1000:>9.2f}")
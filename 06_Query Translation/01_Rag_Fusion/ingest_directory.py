@@ -0,0 +1,137 @@
+# DIRECTORY INGESTION
+# Ingest every PDF of a directory:
+#   1) parse + split PDFs in parallel in a process pool (PyPDF text extraction is CPU bound, so threads would fight over the GIL)
+#   2) feed the split pages into a single embedding/upsert stage as each PDF finishes
+#   3) print a per-file and aggregate throughput report
+#
+# Usage: python ingest_directory.py ../data --processes 8
+#        python ingest_directory.py ../data --fake   (offline embedder, e.g. to benchmark the parse/split phase)
+
+# Import Packages
+import os
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+from embedder import FakeEmbeddings
+from embedding_cache import CachedEmbeddings
+from ingest import split_pdf, should_ingest, ingest_pdf_to_qdrant
+from registry import open_registry
+
+def get_embedding(fake=False):
+    if fake:
+        return FakeEmbeddings(latency=0.0)
+
+    from gemini_embeddings import GeminiEmbeddings
+
+    load_dotenv()
+    return CachedEmbeddings(GeminiEmbeddings(
+        model="models/text-embedding-004",
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+    ))
+
+def print_report(rows, parse_wall, total_wall, processes):
+    print(f"\n{'file':<40} {'pages':>6} {'chunks':>7} {'parse s':>8} {'pages/s':>8} {'embed+upsert s':>15}")
+    for row in rows:
+        print(f"{row['name'][:40]:<40} {row['pages']:>6} {row['chunks']:>7} {row['parse_seconds']:>8.2f} "
+              f"{row['pages'] / row['parse_seconds'] if row['parse_seconds'] else 0:>8.1f} {row['ingest_seconds']:>15.2f}")
+
+    total_pages = sum(row["pages"] for row in rows)
+    total_parse = sum(row["parse_seconds"] for row in rows) # parse time if the files had been done one after another
+    print(f"\n📊 {len(rows)} PDFs, {total_pages} pages, {sum(row['chunks'] for row in rows)} chunks")
+    print(f"   parse/split: {parse_wall:.2f}s wall with {processes} processes, {total_pages / parse_wall if parse_wall else 0:.1f} pages/s "
+          f"({total_parse / parse_wall if parse_wall else 0:.2f}x vs sequential)")
+    print(f"   end to end:  {total_wall:.2f}s, {total_pages / total_wall if total_wall else 0:.1f} pages/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest every PDF of a directory into Qdrant")
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="parse/split worker processes")
+    parser.add_argument("--recursive", action="store_true", help="also ingest PDFs in sub-directories")
+    parser.add_argument("--fake", action="store_true", help="use the offline FakeEmbeddings instead of Gemini")
+    args = parser.parse_args()
+
+    pattern = "**/*.pdf" if args.recursive else "*.pdf"
+    pdf_paths = sorted(args.directory.glob(pattern))
+    if not pdf_paths:
+        print(f"No PDFs found in {args.directory}")
+        return
+
+    # The registry knows documents by file name - with --recursive two different PDFs can share one
+    # (d1/report.pdf, d2/report.pdf) and would be ingested into the same collection, overwriting each other
+    by_name = {}
+    for pdf_path in pdf_paths:
+        by_name.setdefault(pdf_path.name, []).append(pdf_path)
+    for name, paths in by_name.items():
+        if len(paths) > 1:
+            print(f"❌ Skipping {len(paths)} PDFs named '{name}' - rename them so each has a unique file name: {', '.join(map(str, paths))}")
+    pdf_paths = [pdf_path for pdf_path in pdf_paths if len(by_name[pdf_path.name]) == 1]
+
+    # Only new or changed PDFs are parsed
+    collections = {}
+    for pdf_path in pdf_paths:
+        should_ingest_pdf, collection_name = should_ingest(pdf_path)
+        if should_ingest_pdf:
+            collections[pdf_path] = collection_name
+
+    if not collections:
+        print("Nothing to ingest.")
+        return
+
+    embedding = get_embedding(args.fake)
+    rows = []
+    failed = [] # (pdf_path, error) - one bad PDF doesn't stop the others
+    start = time.time()
+
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        futures = {pool.submit(split_pdf, pdf_path): pdf_path for pdf_path in collections}
+
+        # Single embedding/upsert stage - consumes PDFs in the order they finish parsing
+        # Finished futures are popped and their split pages released once ingested, so parsed PDFs don't pile up in memory
+        for future in as_completed(futures):
+            pdf_path = futures.pop(future)
+            try:
+                result = future.result()
+            except Exception as error: # unreadable PDF - release its claim so the next run retries it
+                open_registry().mark_failed(collections[pdf_path], repr(error))
+                failed.append((pdf_path, error))
+                print(f"\n❌ {pdf_path.name} could not be parsed: {error!r}")
+                continue
+            started, finished, pages = result["started"], result["finished"], result["pages"]
+            del result, future
+            print(f"\n📄 {pdf_path.name} parsed in {finished - started:.2f}s")
+
+            try:
+                stats = ingest_pdf_to_qdrant(pdf_path, collections[pdf_path], embedding, split_pages=pages) # marks it failed itself
+            except Exception as error:
+                failed.append((pdf_path, error))
+                print(f"❌ {pdf_path.name} could not be ingested: {error!r}")
+                continue
+            finally:
+                del pages # released before waiting for the next PDF
+            rows.append({
+                "name": pdf_path.name,
+                "pages": stats["pages"],
+                "chunks": stats["chunks"],
+                "started": started,
+                "finished": finished,
+                "parse_seconds": finished - started,
+                "ingest_seconds": stats["seconds"],
+            })
+
+    if rows:
+        parse_wall = max(row["finished"] for row in rows) - min(row["started"] for row in rows)
+        print_report(rows, parse_wall, time.time() - start, args.processes)
+
+    if isinstance(embedding, CachedEmbeddings):
+        embedding.report()
+
+    if failed:
+        print(f"\n❌ {len(failed)} PDF(s) failed (marked failed in the registry, the next run retries them):")
+        for pdf_path, error in failed:
+            print(f"   {pdf_path}: {error!r}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import os
+import json
+import threading
+from pathlib import Path
+import numpy as np
+
+# In-process vector index - a drop-in for a Qdrant collection when no Qdrant container is running.
+# On-disk layout (local_index/<collection>/):
+#   meta.json    -> { "dim": 768, "dtype": "float32" }
+#   vectors.bin  -> raw row-major matrix of L2-normalized vectors, appended on upsert and read through np.memmap
+#   points.jsonl -> one { "id": ..., "payload": {...} } line per row (same payload layout as QdrantVectorStore)
+#   deleted.json -> rows that were deleted or overwritten by a later upsert of the same id
+# The two appends of an upsert aren't atomic together: a crash in between leaves extra vector rows or a partial
+# last line. Loading only trusts rows that are complete in both files, and the next upsert cuts off the rest first.
+# Search is cosine similarity (dot product of normalized vectors), like the Qdrant collections langchain creates.
+# Brute force is one vectorized matrix-vector product - sub-millisecond for a few thousand chunks;
+# for bigger corpora 'hnsw=True' builds an in-memory HNSW graph (needs 'pip install hnswlib').
+
+INDEX_ROOT = Path(__file__).parent / "local_index"
+
+class LocalVectorIndex:
+    def __init__(self, collection_name, root=INDEX_ROOT, dtype="float32", hnsw=False, hnsw_min_points=5000):
+        self.collection_name = collection_name
+        self.path = Path(root) / collection_name
+        self.hnsw = hnsw
+        self.hnsw_min_points = hnsw_min_points
+        self._lock = threading.RLock()
+
+        self.dim = None
+        self.dtype = np.dtype(dtype)
+        self._load()
+
+    # (Re)load rows from disk - also picks up points written by another process (e.g. a separate ingestion run)
+    def _load(self):
+        meta_file = self.path / "meta.json"
+        if self.dim is None and meta_file.exists(): # created since (maybe by another process)
+            meta = json.loads(meta_file.read_text())
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+
+        self._signature = self._files_signature() # taken first - a write racing the load is picked up next time
+        self._ids = []
+        self._payloads = []
+        self._points_end = 0 # byte offset after the last complete line of points.jsonl
+        points_file = self.path / "points.jsonl"
+        vectors_file = self.path / "vectors.bin"
+        max_rows = vectors_file.stat().st_size // self._row_bytes() if vectors_file.exists() and self.dim else 0
+        if points_file.exists():
+            with open(points_file, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n") or len(self._ids) == max_rows: # partial write or row without a vector
+                        break
+                    point = json.loads(line)
+                    self._ids.append(point["id"])
+                    self._payloads.append(point["payload"])
+                    self._points_end += len(line)
+
+        deleted_file = self.path / "deleted.json"
+        deleted = json.loads(deleted_file.read_text()) if deleted_file.exists() else []
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._alive[[row for row in deleted if row < len(self._ids)]] = False
+        self._row_of = {point_id: row for row, point_id in enumerate(self._ids) if self._alive[row]}
+
+        self._matrix = None
+        self._hnsw_index = None
+
+    def _row_bytes(self):
+        return self.dim * self.dtype.itemsize
+
+    # (mtime, size, inode) of the files another process may change - size alone misses a rewrite to the same size
+    # (compaction, or deleted.json after a delete)
+    def _files_signature(self):
+        signature = []
+        for name in ("points.jsonl", "deleted.json"):
+            path = self.path / name
+            stat = path.stat() if path.exists() else None
+            signature.append((stat.st_mtime_ns, stat.st_size, stat.st_ino) if stat else None)
+        return tuple(signature)
+
+    def _refresh_if_changed(self):
+        if self._files_signature() != self._signature:
+            self._load()
+
+    def _vectors(self):
+        if self._matrix is None and self._ids:
+            self._matrix = np.memmap(self.path / "vectors.bin", dtype=self.dtype, mode="r", shape=(len(self._ids), self.dim))
+        return self._matrix
+
+    def _save_deleted(self):
+        tmp_deleted = self.path / "deleted.json.tmp"
+        tmp_deleted.write_text(json.dumps(np.flatnonzero(~self._alive).tolist()))
+        os.replace(tmp_deleted, self.path / "deleted.json") # readers never see a half-written list
+
+    def count(self):
+        return len(self._row_of)
+
+    # [(id, payload), ...] of every live point
+    def points(self):
+        with self._lock:
+            self._refresh_if_changed()
+            return [(point_id, self._payloads[row]) for point_id, row in self._row_of.items()]
+
+    def ensure_collection(self, dim):
+        with self._lock:
+            if self.dim is None:
+                self.path.mkdir(parents=True, exist_ok=True)
+                (self.path / "meta.json").write_text(json.dumps({"dim": dim, "dtype": self.dtype.name}))
+                self.dim = dim
+            elif self.dim != dim:
+                raise ValueError(f"Collection '{self.collection_name}' holds {self.dim}-dim vectors, got {dim}")
+
+    def upsert(self, ids, vectors, payloads):
+        if not ids:
+            return
+
+        vectors = np.array(vectors, dtype=np.float32) # copy - normalized in place below
+        self.ensure_collection(vectors.shape[1])
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        with self._lock:
+            self._refresh_if_changed()
+
+            first_row = len(self._ids)
+
+            # Cut off what an interrupted upsert left behind, so the new rows line up in both files
+            for name, size in (("vectors.bin", first_row * self._row_bytes()), ("points.jsonl", self._points_end)):
+                path = self.path / name
+                if path.exists() and path.stat().st_size > size:
+                    os.truncate(path, size)
+
+            with open(self.path / "vectors.bin", "ab") as f:
+                f.write(vectors.astype(self.dtype).tobytes())
+            with open(self.path / "points.jsonl", "ab") as f:
+                for point_id, payload in zip(ids, payloads):
+                    line = (json.dumps({"id": point_id, "payload": payload}) + "\n").encode("utf-8")
+                    f.write(line)
+                    self._points_end += len(line)
+
+            self._ids.extend(ids)
+            self._payloads.extend(payloads)
+            # Overwritten ids (earlier rows, or an earlier occurrence in this same batch) -> old rows become dead
+            replaced = []
+            for offset, point_id in enumerate(ids):
+                if point_id in self._row_of:
+                    replaced.append(self._row_of[point_id])
+                self._row_of[point_id] = first_row + offset
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._alive[replaced] = False
+            if replaced:
+                self._save_deleted()
+
+            self._matrix = None
+            self._signature = self._files_signature()
+            if self._hnsw_index is not None:
+                if self._hnsw_index.get_max_elements() < len(self._ids):
+                    self._hnsw_index.resize_index(len(self._ids) * 2)
+                self._hnsw_index.add_items(vectors, np.arange(first_row, first_row + len(ids)))
+                for row in replaced:
+                    self._hnsw_index.mark_deleted(row)
+
+    def delete(self, ids):
+        with self._lock:
+            self._refresh_if_changed()
+            rows = [self._row_of.pop(point_id) for point_id in ids if point_id in self._row_of]
+            if not rows:
+                return
+            self._alive[rows] = False
+            self._save_deleted()
+            self._signature = self._files_signature()
+            if self._hnsw_index is not None:
+                for row in rows:
+                    self._hnsw_index.mark_deleted(row)
+
+            if (~self._alive).sum() > len(self._ids) // 2:
+                self.compact()
+
+    # Rewrite the files without dead rows
+    def compact(self):
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            vectors = np.array(self._vectors()[rows]) if len(rows) else np.empty((0, self.dim), dtype=self.dtype)
+            ids = [self._ids[row] for row in rows]
+            payloads = [self._payloads[row] for row in rows]
+
+            self._matrix = None # release the memmap before replacing the file
+            tmp_vectors = self.path / "vectors.bin.tmp"
+            tmp_points = self.path / "points.jsonl.tmp"
+            tmp_vectors.write_bytes(vectors.tobytes())
+            with open(tmp_points, "w") as f:
+                for point_id, payload in zip(ids, payloads):
+                    f.write(json.dumps({"id": point_id, "payload": payload}) + "\n")
+            os.replace(tmp_vectors, self.path / "vectors.bin")
+            os.replace(tmp_points, self.path / "points.jsonl")
+            (self.path / "deleted.json").write_text("[]")
+            self._load()
+
+    def _build_hnsw(self):
+        import hnswlib
+
+        vectors = self._vectors()
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(max_elements=max(len(self._ids) * 2, 1024), ef_construction=200, M=16)
+        index.add_items(np.asarray(vectors, dtype=np.float32), np.arange(len(self._ids)))
+        for row in np.flatnonzero(~self._alive):
+            index.mark_deleted(int(row))
+        index.set_ef(128)
+        self._hnsw_index = index
+
+    # Top-k rows for each query vector -> [[(row, score), ...], ...]
+    def _top_k(self, queries, k):
+        queries = np.array(queries, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        k = min(k, self.count())
+        if k == 0:
+            return [[] for _ in queries]
+
+        if self.hnsw and self.count() >= self.hnsw_min_points:
+            if self._hnsw_index is None:
+                self._build_hnsw()
+            labels, distances = self._hnsw_index.knn_query(queries, k=k)
+            return [[(int(row), 1.0 - float(distance)) for row, distance in zip(row_labels, row_distances)] # ip distance = 1 - dot
+                    for row_labels, row_distances in zip(labels, distances)]
+
+        scores = queries @ np.asarray(self._vectors(), dtype=np.float32).T # (n_queries x n_rows) in one pass
+        scores[:, ~self._alive] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k] # unordered top-k per row, O(n)
+        results = []
+        for query_scores, rows in zip(scores, top):
+            rows = rows[np.argsort(-query_scores[rows])]
+            results.append([(int(row), float(query_scores[row])) for row in rows])
+        return results
+
+    def _hit(self, row, score, with_vectors):
+        hit = {"id": self._ids[row], "score": score, "payload": self._payloads[row]}
+        if with_vectors:
+            hit["vector"] = np.asarray(self._vectors()[row], dtype=np.float32)
+        return hit
+
+    # All queries in one vectorized pass - (n_queries x dim) @ (dim x n_rows)
+    def search_batch(self, vectors, k, with_vectors=False):
+        if len(vectors) == 0:
+            return []
+        with self._lock:
+            self._refresh_if_changed()
+            return [[self._hit(row, score, with_vectors) for row, score in rows] for rows in self._top_k(vectors, k)]
+
+    def search(self, vector, k, with_vectors=False):
+        return self.search_batch([vector], k, with_vectors)[0]
+
+    # { id: normalized vector } of the given live points
+    def get_vectors(self, ids):
+        with self._lock:
+            self._refresh_if_changed()
+            rows = [(point_id, self._row_of[point_id]) for point_id in ids if point_id in self._row_of]
+            return {point_id: np.asarray(self._vectors()[row], dtype=np.float32) for point_id, row in rows}
+
+    # Async interface (same as QdrantBackend) - local searches are in-process NumPy work, nothing to await
+    async def asearch_batch(self, vectors, k, with_vectors=False):
+        return self.search_batch(vectors, k, with_vectors)
+
+    async def asearch(self, vector, k, with_vectors=False):
+        return self.search(vector, k, with_vectors)
+
+    async def aget_vectors(self, ids):
+        return self.get_vectors(ids)
+
+    # Local writes are applied immediately - nothing to wait for
+    def barrier(self):
+        pass
+
+    def close(self):
+        self._matrix = None
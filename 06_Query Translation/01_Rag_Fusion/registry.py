@@ -0,0 +1,231 @@
+import os
+import re
+import time
+import socket
+import sqlite3
+import threading
+from pathlib import Path
+from functools import lru_cache
+from contextlib import contextmanager
+
+# Ingestion registry (SQLite) - replaces the old 'ingested_pdfs.txt'
+# One row per document name, indexed by name and content hash, with an ingest status:
+#   pending  -> an ingestor has claimed the document and is ingesting it
+#   complete -> the collection holds the current content of the document
+#   failed   -> the last ingestion raised, the next run re-claims it
+# Claims happen inside 'BEGIN IMMEDIATE' transactions, so two ingestors can never claim the same document.
+
+REGISTRY_FILE = "ingested_pdfs.db"
+STALE_CLAIM_SECONDS = 600 # a pending claim without a heartbeat for this long belongs to a dead ingestor
+
+def make_collection_name(pdf_path, content_hash):
+    clean_name = re.sub(r'[^a-zA-Z0-9]+', '_', pdf_path.stem)
+    short_name = '_'.join(clean_name.split('_')[:3])
+    return f"{short_name}_{content_hash[:8]}" # derived from the content instead of a random suffix, so it can't collide
+
+class IngestRegistry:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+
+        # isolation_level=None -> we control transactions ourselves; timeout -> wait for other writers instead of failing
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                name TEXT PRIMARY KEY,
+                content_hash TEXT,
+                collection TEXT NOT NULL UNIQUE,
+                status TEXT NOT NULL CHECK (status IN ('pending', 'complete', 'failed')),
+                owner TEXT,
+                heartbeat REAL,
+                error TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash);
+        """)
+
+        # Per-batch progress (checkpoint) columns - added to registries created before they existed
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        # 'version' is bumped whenever the content of a collection changes (retrieval caches key on it)
+        for column in ("pages_done", "total_pages", "chunks_done", "batches_done", "version"):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE documents ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+
+        self._import_legacy_registry(self.path.parent / "ingested_pdfs.txt")
+
+    # One-time import of the old "pdf_name:collection" / "pdf_name:file_hash:collection" lines
+    def _import_legacy_registry(self, legacy_file):
+        if not legacy_file.exists() or self._conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone():
+            return
+
+        rows = []
+        for line in legacy_file.read_text().splitlines():
+            parts = line.split(":")
+            if len(parts) < 2:
+                continue
+            content_hash = parts[-2] if len(parts) >= 3 else None
+            name = ":".join(parts[:-2] if content_hash else parts[:-1])
+            rows.append((name, content_hash, parts[-1].strip(), time.time()))
+
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO documents (name, content_hash, collection, status, updated_at) VALUES (?, ?, ?, 'complete', ?)",
+                rows
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE") # take the write lock up front -> claims are atomic across processes
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # False only when we can tell the owning process is gone (same host, pid no longer running)
+    @staticmethod
+    def _owner_is_alive(owner):
+        host, _, pid = (owner or "").rpartition(":")
+        if host != socket.gethostname() or not pid.isdigit():
+            return True
+
+        try:
+            import psutil
+            return psutil.pid_exists(int(pid))
+        except ImportError:
+            pass
+
+        if os.name == "nt":
+            return True # no reliable check without psutil, fall back to the heartbeat timeout
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _is_claimed_by_other(self, row):
+        return (
+            row["status"] == "pending"
+            and row["owner"] != self.owner
+            and time.time() - (row["heartbeat"] or 0) < STALE_CLAIM_SECONDS
+            and self._owner_is_alive(row["owner"])
+        )
+
+    # Atomic claim-before-ingest. Returns (action, collection) where action is
+    #   "ingest" -> this process owns the document now and must ingest it
+    #   "resume" -> same, but a previous run stopped half way - it continues from its last committed batch
+    #   "skip"   -> the content is already ingested
+    #   "busy"   -> another ingestor is ingesting it right now
+    def claim(self, pdf_path, content_hash):
+        name = pdf_path.name
+        now = time.time()
+
+        with self._transaction():
+            # Same content under any name
+            row = self._conn.execute("SELECT * FROM documents WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone()
+            if row is None:
+                row = self._conn.execute("SELECT * FROM documents WHERE name = ?", (name,)).fetchone()
+
+                # Old registry line without a hash - adopt the current content instead of re-ingesting
+                if row is not None and row["content_hash"] is None and row["status"] == "complete":
+                    self._conn.execute("UPDATE documents SET content_hash = ?, updated_at = ? WHERE name = ?", (content_hash, now, name))
+                    return "skip", row["collection"]
+
+            if row is not None:
+                if row["status"] == "complete" and row["content_hash"] == content_hash:
+                    return "skip", row["collection"]
+                if self._is_claimed_by_other(row):
+                    return "busy", row["collection"]
+
+                # Changed content, failed or abandoned ingestion -> re-claim the existing collection
+                self._conn.execute(
+                    "UPDATE documents SET content_hash = ?, status = 'pending', owner = ?, heartbeat = ?, error = NULL, updated_at = ?, version = version + 1 WHERE name = ?",
+                    (content_hash, self.owner, now, now, row["name"])
+                )
+                interrupted = row["status"] != "complete" and row["content_hash"] == content_hash
+                return ("resume" if interrupted else "ingest"), row["collection"]
+
+            collection = make_collection_name(pdf_path, content_hash)
+            self._conn.execute(
+                "INSERT INTO documents (name, content_hash, collection, status, owner, heartbeat, updated_at) VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+                (name, content_hash, collection, self.owner, now, now)
+            )
+            return "ingest", collection
+
+    def _set_status(self, collection, status, error=None):
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE documents SET status = ?, error = ?, heartbeat = ?, updated_at = ?, version = version + 1 WHERE collection = ?",
+                (status, error, time.time(), time.time(), collection)
+            )
+
+    # Checkpoint after every committed batch - also keeps the pending claim alive while a long ingestion is running
+    def record_progress(self, collection, progress):
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE documents SET heartbeat = ?, pages_done = ?, total_pages = ?, chunks_done = ?, batches_done = ?, version = version + 1 "
+                "WHERE collection = ? AND status = 'pending'",
+                (time.time(), progress["pages"], progress["total_pages"], progress["chunks"], progress["batches"], collection)
+            )
+
+    def mark_complete(self, collection):
+        self._set_status(collection, "complete")
+
+    def mark_failed(self, collection, error):
+        self._set_status(collection, "failed", error=str(error)[:500])
+
+    def get(self, collection):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE collection = ?", (collection,)).fetchone()
+        return dict(row) if row else None
+
+    # 0 for collections the registry doesn't know (e.g. created by hand)
+    def collection_version(self, collection):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM documents WHERE collection = ?", (collection,)).fetchone()
+        return row["version"] if row else 0
+
+    def documents(self, status=None):
+        query = "SELECT * FROM documents" + (" WHERE status = ?" if status else "") + " ORDER BY updated_at DESC"
+        with self._lock:
+            rows = self._conn.execute(query, (status,) if status else ()).fetchall()
+        return [dict(row) for row in rows]
+
+# One registry connection per file per process
+@lru_cache(maxsize=None)
+def open_registry(registry_file=REGISTRY_FILE):
+    return IngestRegistry(Path(__file__).parent / registry_file)
+
+
+# Status command - shows partially ingested (pending / failed) collections
+# python registry.py          -> unfinished documents only
+# python registry.py --all    -> every document
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show the ingestion status of registered PDFs")
+    parser.add_argument("--all", action="store_true", help="include completely ingested documents")
+    args = parser.parse_args()
+
+    registry = open_registry()
+    documents = [doc for doc in registry.documents() if args.all or doc["status"] != "complete"]
+    if not documents:
+        print("✅ No partially ingested collections.")
+
+    for doc in documents:
+        total = doc["total_pages"] or "?"
+        age = f"{time.time() - doc['heartbeat']:.0f}s ago" if doc["heartbeat"] else "never"
+        print(f"{doc['status'].upper():<9} {doc['collection']:<32} {doc['name']}")
+        print(f"          pages {doc['pages_done']}/{total}, {doc['chunks_done']} chunks, {doc['batches_done']} batches committed, last checkpoint {age}")
+        if doc["status"] == "pending":
+            alive = registry._owner_is_alive(doc["owner"]) and time.time() - (doc["heartbeat"] or 0) < STALE_CLAIM_SECONDS
+            print(f"          owner {doc['owner']} ({'running' if alive else 'abandoned - the next run resumes it'})")
+        if doc["error"]:
+            print(f"          error: {doc['error']}")
@@ -0,0 +1,101 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+# In-memory cache of retrieval results, keyed by (collection, collection version, normalized query, k, score_threshold, mode).
+# - LRU: the least recently used entries are evicted first
+# - TTL: entries older than ttl_seconds are treated as misses
+# - memory cap: the estimated size of all cached results stays under max_bytes
+# The collection version comes from the ingestion registry and is bumped whenever the collection is (re-)ingested,
+# so results of an old version are never served - they simply age out of the LRU.
+class RetrievalCache:
+    def __init__(self, max_entries=1024, ttl_seconds=600, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (results, created_at, size, seconds_to_compute)
+        self._bytes = 0
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.seconds_saved = 0.0
+
+    # Same question with different case / whitespace -> same entry
+    @staticmethod
+    def normalize(query):
+        return " ".join(query.lower().split())
+
+    def make_key(self, collection_name, version, query, k, score_threshold, mode="dense"):
+        return (collection_name, version, self.normalize(query), k, score_threshold, mode)
+
+    # Rough size of a result list (the chunk texts dominate)
+    @staticmethod
+    def _size(results):
+        return sys.getsizeof(results) + sum(
+            sys.getsizeof(chunk) + sum(sys.getsizeof(value) for value in chunk.values()) for chunk in results
+        )
+
+    def _pop(self, key):
+        _, _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    # Copy of the cached results, or None on a miss
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+                self._pop(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.seconds_saved += entry[3]
+            return [dict(chunk) for chunk in entry[0]] # callers may modify their chunks
+
+    # seconds - how long the retrieval took (embedding + search), i.e. what a hit saves
+    def put(self, key, results, seconds=0.0):
+        results = [dict(chunk) for chunk in results]
+        size = self._size(results)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (results, time.time(), size, seconds)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "estimated_seconds_saved": self.seconds_saved,
+        }
+
+    def report(self):
+        s = self.stats()
+        print(f"🔎 Retrieval cache: {s['hits']} hits / {s['misses']} misses ({s['hit_ratio']:.0%} hit ratio), "
+              f"~{s['estimated_seconds_saved']:.1f}s of retrieval latency saved, {s['entries']} cached results ({s['bytes'] / 1024:.0f} KB)")
@@ -1,103 +1,320 @@
+import os
+import time
 import asyncio
-from langchain_qdrant import QdrantVectorStore
-from collections import defaultdict
-
-# Retrieve relevant chunks from Qdrant for each query
-def retrieve_relevant_chunks(user_query, max_chunks, embedding, collection_name, score_threshold=0.7):
-    vector_store = QdrantVectorStore.from_existing_collection(
-        url="http://localhost:6333",
-        collection_name=collection_name,
-        embedding=embedding
-    )
-
-    # Perform similarity search with the specified number of chunks
-    results = vector_store.similarity_search_with_score(user_query, k=max_chunks)
+from concurrent.futures import ThreadPoolExecutor
+from vector_backends import get_vector_backend
+from registry import open_registry
+from retrieval_cache import RetrievalCache
+from embedding_cache import embed_queries, aembed_queries
+from bm25_index import get_bm25_index, fuse_hits
+from mmr import mmr_rerank
+from rrf import rrf_top
 
+# Search hits -> result dicts with content and metadata (hits below score_threshold are dropped)
+def format_results(results, score_threshold):
     final_result = []
 
     # Prepare the final result with content and metadata
-    for result, score in results:
-        if score >= score_threshold:
+    for result in results:
+        metadata = result["payload"].get("metadata") or {}
+        if result["score"] >= score_threshold:
             final_result.append({
-                "content": result.page_content if hasattr(result, 'page_content') else "",
-                "page_num": result.metadata.get("page", ""),
-                "total_pages": result.metadata.get("total_pages", ""),
-                "score": score
+                "id": result["id"], # stable point id from ingestion (same chunk -> same id in every result list)
+                "content": result["payload"].get("page_content", ""),
+                "page_num": metadata.get("page", ""),
+                "total_pages": metadata.get("total_pages", ""),
+                "start_index": metadata.get("start_index"), # offset in the page - lets context_packer.py merge neighbours
+                "score": result["score"]
             })
+    return final_result
+
+# Retrieval mode (RETRIEVAL_MODE environment variable or the 'mode' argument):
+#   dense  -> vector search only
+#   hybrid -> vector search + BM25 keyword search (bm25_index.py) run concurrently and fused with RRF;
+#             the cosine score_threshold applies to the dense hits, "score" of a hybrid result is its fused RRF score
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+_sparse_pool = ThreadPoolExecutor(max_workers=4) # keyword searches run here while the query is embedded
+
+def check_mode(mode):
+    mode = mode or RETRIEVAL_MODE
+    if mode not in ("dense", "hybrid"):
+        raise ValueError(f"Unknown retrieval mode '{mode}' (expected dense or hybrid)")
+    return mode
+
+# Optional MMR diversity stage (mmr.py): mmr_k - how many chunks to keep out of the max_chunks retrieved (None = off),
+# mmr_lambda - relevance vs diversity (1.0 = relevance only)
+def cache_mode(mode, mmr_k, mmr_lambda):
+    return mode if mmr_k is None else f"{mode}+mmr:{mmr_k}:{mmr_lambda}"
+
+# Process-wide result cache - repeated questions skip both the embedding call and the search
+retrieval_cache = RetrievalCache()
+
+# Bumped by the ingestion registry on every (re-)ingest, so cached results of a re-ingested collection are never served
+def collection_version(collection_name):
+    return open_registry().collection_version(collection_name)
+
+# Retrieve relevant chunks from the vector store for each query
+def retrieve_relevant_chunks(user_query, max_chunks, embedding, collection_name, score_threshold=0.7, backend=None, query_vector=None, mode=None,
+                             mmr_k=None, mmr_lambda=0.5):
+    mode = check_mode(mode)
+    cache_key = retrieval_cache.make_key(
+        collection_name, collection_version(collection_name), user_query, max_chunks, score_threshold, cache_mode(mode, mmr_k, mmr_lambda)
+    )
+    cached = retrieval_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+
+    # Qdrant or the local index, picked by VECTOR_BACKEND (see vector_backends.py)
+    store = get_vector_backend(collection_name, backend)
+    sparse_future = _sparse_pool.submit(get_bm25_index(collection_name).search, user_query, max_chunks) if mode == "hybrid" else None
+
+    # Perform similarity search with the specified number of chunks (query_vector - already embedded by the caller)
+    if query_vector is None:
+        query_vector = embedding.embed_query(user_query)
+    results = store.search(query_vector, k=max_chunks, with_vectors=mmr_k is not None)
+
+    if sparse_future:
+        dense = [hit for hit in results if hit["score"] >= score_threshold]
+        results = fuse_hits(dense, sparse_future.result(), max_chunks)
+        score_threshold = float("-inf") # already applied to the dense hits
+
+    # Diverse mmr_k out of the candidates that passed the threshold
+    if mmr_k is not None:
+        results = mmr_rerank([hit for hit in results if hit["score"] >= score_threshold], [query_vector], store, mmr_k, mmr_lambda)
+    final_result = format_results(results, score_threshold)
 
     # print(f"\nQUERY: {user_query} -------- CHUNKS: {final_result}\n\n")
     
+    retrieval_cache.put(cache_key, final_result, time.perf_counter() - started)
+
     # Return the final result containing relevant chunks
     return final_result
 
-# Async wrapper for the synchronous retrieval function (retrieve_relevant_chunks)
-async def async_retrieve_chunks(query, max_chunks, embedding, collection_name):
-    # run synchronous 'retrieve_relevant_chunks' function in a thread
-    result = await asyncio.to_thread(retrieve_relevant_chunks, query, max_chunks, embedding, collection_name)
+# Cache lookup of a batch -> (cache keys, results with None for every miss, indexes of the misses)
+def lookup_batch(queries, max_chunks, collection_name, score_threshold, mode):
+    version = collection_version(collection_name)
+    cache_keys = [retrieval_cache.make_key(collection_name, version, query, max_chunks, score_threshold, mode) for query in queries]
+    results = [retrieval_cache.get(cache_key) for cache_key in cache_keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    return cache_keys, results, missing
+
+# Fuse (hybrid), format and cache the search hits of the misses
+def finish_batch(cache_keys, results, missing, searched, sparse_results, max_chunks, score_threshold, started):
+    if sparse_results is not None:
+        searched = [
+            fuse_hits([hit for hit in dense if hit["score"] >= score_threshold], sparse, max_chunks)
+            for dense, sparse in zip(searched, sparse_results)
+        ]
+        score_threshold = float("-inf") # already applied to the dense hits
+
+    seconds = (time.perf_counter() - started) / len(missing)
+    for i, hits in zip(missing, searched):
+        results[i] = format_results(hits, score_threshold)
+        retrieval_cache.put(cache_keys[i], results[i], seconds)
+    return results
+
+# Retrieve chunks for many queries with one batch search (one Qdrant request / one matrix product locally).
+# Cached queries are answered from the retrieval cache, only the misses are embedded (in one call) and searched.
+def retrieve_relevant_chunks_batch(queries, max_chunks, embedding, collection_name, score_threshold=0.7, backend=None, query_vectors=None, mode=None):
+    mode = check_mode(mode)
+    cache_keys, results, missing = lookup_batch(queries, max_chunks, collection_name, score_threshold, mode)
+    if not missing:
+        return results
+
+    started = time.perf_counter()
+    store = get_vector_backend(collection_name, backend)
+    sparse_future = None
+    if mode == "hybrid":
+        sparse_future = _sparse_pool.submit(get_bm25_index(collection_name).search_batch, [queries[i] for i in missing], max_chunks)
+    if query_vectors is None:
+        missing_vectors = embed_queries(embedding, [queries[i] for i in missing])
+    else:
+        missing_vectors = [query_vectors[i] for i in missing]
+
+    searched = store.search_batch(missing_vectors, k=max_chunks)
+    sparse_results = sparse_future.result() if sparse_future else None
+    return finish_batch(cache_keys, results, missing, searched, sparse_results, max_chunks, score_threshold, started)
+
+# Async version of retrieve_relevant_chunks_batch - the search (AsyncQdrantClient) is awaited on the event loop,
+# so many conversations can fan out at once without a thread per in-flight search. The embedding batch
+# (aembed_queries - a worker thread for Gemini, to keep the query task type) and the keyword search (SQLite,
+# the small _sparse_pool) still use threads; cached queries need neither.
+async def aretrieve_relevant_chunks_batch(queries, max_chunks, embedding, collection_name, score_threshold=0.7, backend=None, query_vectors=None, mode=None):
+    mode = check_mode(mode)
+    cache_keys, results, missing = lookup_batch(queries, max_chunks, collection_name, score_threshold, mode)
+    if not missing:
+        return results
+
+    started = time.perf_counter()
+    store = get_vector_backend(collection_name, backend)
+    sparse_future = None
+    if mode == "hybrid":
+        sparse_future = asyncio.get_running_loop().run_in_executor(
+            _sparse_pool, get_bm25_index(collection_name).search_batch, [queries[i] for i in missing], max_chunks
+        )
+    if query_vectors is None:
+        missing_vectors = await aembed_queries(embedding, [queries[i] for i in missing])
+    else:
+        missing_vectors = [query_vectors[i] for i in missing]
+
+    searched = await store.asearch_batch(missing_vectors, k=max_chunks)
+    sparse_results = await sparse_future if sparse_future else None
+    return finish_batch(cache_keys, results, missing, searched, sparse_results, max_chunks, score_threshold, started)
+
+# Retrieve chunks for one query on the event loop (async path - see aretrieve_relevant_chunks_batch)
+async def async_retrieve_chunks(query, max_chunks, embedding, collection_name, query_vector=None):
+    query_vectors = None if query_vector is None else [query_vector]
+    result = (await aretrieve_relevant_chunks_batch([query], max_chunks, embedding, collection_name, query_vectors=query_vectors))[0]
     print(f"For Query -> {query} - {len(result)} chunks found")
     return result
 
 # Parallel Processing (retrieve chunks from all the queries concurrently)
-async def process_queries_parallely(queries, max_chunks, embedding, collection_name):
-    # list of tasks to call 'async_retrieve_chunks'
-    tasks = [
-        async_retrieve_chunks(query, max_chunks, embedding, collection_name) 
-        for query in queries 
-    ]
-
-    # run tasks concurrently
-    results = await asyncio.gather(*tasks) # output list of list (array or array) [[], [], ...]
+async def process_queries_parallely(queries, max_chunks, embedding, collection_name, query_vectors=None):
+    # cached queries are served from memory; the rest are embedded in one batched request (1 round trip instead of N)
+    # and searched in one batch search - both awaited on the event loop
+    results = await aretrieve_relevant_chunks_batch(
+        queries, max_chunks, embedding, collection_name, query_vectors=query_vectors
+    ) # output list of list (array or array) [[], [], ...]
+
+    for query, result in zip(queries, results):
+        print(f"For Query -> {query} - {len(result)} chunks found")
     return results
 
+# How the scores of a chunk returned by several queries are combined
+MERGE_POLICIES = {
+    "max": max, # best similarity to any of the queries
+    "sum": sum, # rewards chunks that many queries agree on
+    "mean": lambda scores: sum(scores) / len(scores),
+}
+
+# Dedup by point id and merge the scores of each chunk - sorted by merged score (highest first).
+# policy "first" keeps the old behaviour: first occurrence wins, in retrieval order.
+def merge_chunks(lists_of_chunks, policy="max"):
+    if policy != "first" and policy not in MERGE_POLICIES:
+        raise ValueError(f"Unknown merge policy '{policy}' (expected first, {', '.join(MERGE_POLICIES)})")
+
+    merged = {} # point id -> (chunk, [score from every list that returned it])
+    for chunk_list in lists_of_chunks:
+        for chunk in chunk_list:
+            if not chunk.get("content"):
+                continue
+            key = chunk.get("id") or chunk["content"] # chunks without an id (older caches) fall back to their text
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = (dict(chunk), [chunk["score"]])
+            else:
+                entry[1].append(chunk["score"])
+
+    if policy == "first":
+        return [chunk for chunk, _ in merged.values()]
+
+    aggregate = MERGE_POLICIES[policy]
+    for chunk, scores in merged.values():
+        chunk["score"] = aggregate(scores)
+    return sorted((chunk for chunk, _ in merged.values()), key=lambda chunk: chunk["score"], reverse=True)
+
+# MMR over the fused chunks of several queries - relevance is the best similarity to any of the queries
+async def fused_mmr(chunks, query_vectors, collection_name, mmr_k, mmr_lambda):
+    store = get_vector_backend(collection_name)
+    vectors = await store.aget_vectors([chunk["id"] for chunk in chunks if chunk.get("id")])
+    with_vectors = [{**chunk, "vector": vectors[chunk["id"]]} for chunk in chunks if chunk.get("id") in vectors]
+    return mmr_rerank(with_vectors, query_vectors, store, mmr_k, mmr_lambda)
+
+# Speculative retrieval - prefetched is { query: task } of retrievals started before the sub-queries were generated
+# (the user's question, retrieved while the LLM works). Generated queries equal to one of them are not retrieved again,
+# the prefetched lists come first, then one list per remaining query.
+# Returns (lists of chunks, vectors of the queries in the same order - only when with_query_vectors, e.g. for MMR)
+async def gather_chunk_lists(queries, max_chunks, embedding, collection_name, prefetched=None, with_query_vectors=False):
+    prefetched = prefetched or {}
+    started = {" ".join(query.lower().split()) for query in prefetched}
+    pending = [query for query in queries if " ".join(query.lower().split()) not in started]
+
+    # MMR needs the query vectors - embed them once here and let the batch retrieval reuse them
+    query_vectors = await aembed_queries(embedding, list(prefetched) + pending) if with_query_vectors else None
+    pending_vectors = query_vectors[len(prefetched):] if query_vectors is not None else None
+
+    lists_of_chunks = await process_queries_parallely(pending, max_chunks, embedding, collection_name, pending_vectors)
+    prefetched_lists = await asyncio.gather(*prefetched.values())
+    return list(prefetched_lists) + lists_of_chunks, query_vectors
+
 # Parallel Query Retrieval
-async def parallel_query_retrieval(generated_queries, max_chunks, embedding, collection_name):
+# mmr_k / mmr_lambda - optional MMR stage over the merged chunks (see cache_mode)
+# prefetched - speculative retrievals already running (see gather_chunk_lists)
+async def parallel_query_retrieval(generated_queries, max_chunks, embedding, collection_name, merge_policy="max", mmr_k=None, mmr_lambda=0.5, prefetched=None):
     # Retrieve relevant chunks - output array of array
-    retrieved_lists_of_chunks = await process_queries_parallely(generated_queries, max_chunks, embedding, collection_name)
+    retrieved_lists_of_chunks, query_vectors = await gather_chunk_lists(
+        generated_queries, max_chunks, embedding, collection_name, prefetched, with_query_vectors=mmr_k is not None
+    )
 
-    # Flatten results - add all the chunks in one list
-    combined_chunks = [] # instead of for loops, you can do - [chunk for result in all_results for chunk in result]
-    for chunk_list in retrieved_lists_of_chunks:
-        for chunk in chunk_list:
-            combined_chunks.append(chunk)
-                
-    # Remove duplicates
-    unique_chunks = {}
-    for chunk in combined_chunks:
-        content = chunk.get("content", "") # get value from "page_content"
-        if content and content not in unique_chunks:
-            unique_chunks[content] = chunk # key is page_content and value is entire chunk
-
-    final_chunks = []
-    for chunk in unique_chunks.values():
-        final_chunks.append(chunk)
+    # Flatten + remove duplicates (by point id) + merge their scores
+    final_chunks = merge_chunks(retrieved_lists_of_chunks, merge_policy)
+    if mmr_k is not None:
+        final_chunks = await fused_mmr(final_chunks, query_vectors, collection_name, mmr_k, mmr_lambda)
 
     print(f"️🟩 Successfully retrieved {len(final_chunks)} chunks\n")
     return final_chunks
 
-# Reciprocal Rank Fusion (RRF)
-async def reciprocal_rank_fusion(queries, max_chunks, embedding, collection_name, k = 60):
-    lists_of_chunks = await process_queries_parallely(queries, max_chunks, embedding, collection_name)
+# Reciprocal Rank Fusion (RRF) over ranked lists of chunks - one pass + heap top-k, O(total chunks + n log top_k)
+# weights - optional weight per list (e.g. trust the user's original query more than generated ones)
+# top_k - keep only the best top_k chunks (None = all of them)
+def fuse_rankings(lists_of_chunks, k=60, weights=None, top_k=None):
+    # point id (or content for chunks without one) identifies a chunk across the lists
+    fused = rrf_top(lists_of_chunks, lambda chunk: chunk.get("id") or chunk["content"], k, weights, top_k)
+    return [chunk for _, chunk in fused]
+
+# prefetched - speculative retrievals already running, their lists come first (index 0 of weights = the user's question)
+async def reciprocal_rank_fusion(queries, max_chunks, embedding, collection_name, k = 60, weights = None, top_k = None, mmr_k = None, mmr_lambda = 0.5, prefetched = None):
+    lists_of_chunks, query_vectors = await gather_chunk_lists(
+        queries, max_chunks, embedding, collection_name, prefetched, with_query_vectors=mmr_k is not None
+    )
+    fused = fuse_rankings(lists_of_chunks, k, weights, top_k)
+    if mmr_k is not None:
+        fused = await fused_mmr(fused, query_vectors, collection_name, mmr_k, mmr_lambda)
+    return fused
 
-    scores = defaultdict(float)
+# Per-query latency: a new QdrantVectorStore per query (old) vs the pooled backend (new), embeddings faked so only
+# client setup + search is measured. Needs an ingested collection of 768-dim vectors:
+# python retrieve.py <collection_name> --queries 50
+if __name__ == "__main__":
+    import argparse
+    import statistics
+    from langchain_qdrant import QdrantVectorStore
+    from embedder import FakeEmbeddings
+    from vector_backends import QDRANT_URL
 
-    for chunk_list in lists_of_chunks:
-        for rank, chunk in enumerate(chunk_list): # rank is a index and will starts from 0
-            content = chunk["content"] # page_content in vector db
-            scores[content] += 1 / (k + rank + 1) # e.g. -> chunk A -> chunk A.content is key and score will be incremented each time chunk A appears in any other chunk_list
-
-    # Sort by score in descending order - high score = higher ranked chunk
-    ranked_chunks = sorted(scores.items(), key = lambda x: x[1], reverse = True) # scores.items() will return list of tuples ("chunk1", 00.22) so we get access of score by x[1]
-
-    # Rebuild chunk objects from content
-    final_chunks = []
-    seen = set()
-
-    ## NOTE: below logic is expensive O(N * M) in worst case - so improve it later
-    for content, _ in ranked_chunks: # ranked_chunks contain [(chunk, score), ...]
-        for chunk_list in lists_of_chunks: # list_of_chunks [[], [], [], ...]
-            for chunk in chunk_list: # chunk_list [{}, {}, {}, ...]
-                if chunk["content"] == content and content not in seen:
-                    final_chunks.append(chunk)
-                    seen.add(content)
-                    break
-    return final_chunks
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Compare per-query retrieval latency with and without the pooled client")
+    parser.add_argument("collection_name")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    embedding = FakeEmbeddings(latency=0)
+    retrieval_cache.max_entries = 0 # measure the client, not the result cache
+    queries = [f"benchmark query number {i}" for i in range(args.queries)]
+
+    def old_retrieve(query, max_chunks, embedding, collection_name):
+        vector_store = QdrantVectorStore.from_existing_collection(url=QDRANT_URL, collection_name=collection_name, embedding=embedding)
+        return vector_store.similarity_search_with_score(query, k=max_chunks)
+
+    def report(name, latencies, fan_out_seconds):
+        latencies = sorted(latencies)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+        print(f"{name:<28} median {statistics.median(latencies) * 1000:7.2f} ms   p95 {p95 * 1000:7.2f} ms   "
+              f"fan-out of {len(queries)} {fan_out_seconds * 1000:8.1f} ms")
+
+    for name, retrieve in (("new client per query (old)", old_retrieve), ("pooled client (new)", retrieve_relevant_chunks)):
+        retrieve("warm up", args.k, embedding, args.collection_name)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            retrieve(query, args.k, embedding, args.collection_name)
+            latencies.append(time.perf_counter() - start)
+
+        async def fan_out():
+            await asyncio.gather(*(asyncio.to_thread(retrieve, query, args.k, embedding, args.collection_name) for query in queries))
+
+        start = time.perf_counter()
+        asyncio.run(fan_out())
+        report(name, latencies, time.perf_counter() - start)
@@ -0,0 +1,24 @@
+import heapq
+
+# Reciprocal Rank Fusion (RRF) - shared by the multi-query fusion (fuse_rankings in retrieve.py)
+# and the dense + keyword fusion of hybrid retrieval (fuse_hits in bm25_index.py).
+# Every list adds weight / (k + rank) to the score of each item it contains (rank starts at 1),
+# so items ranked high in several lists come first.
+
+# ranked_lists - lists of items, best first; key(item) -> identity of an item across lists
+# Returns [(rrf score, first-seen item), ...] highest score first, top_k of them (all if None).
+# Ties keep their first-seen order, like a stable sort.
+def rrf_top(ranked_lists, key, k=60, weights=None, top_k=None):
+    fused = {} # key -> [score, first-seen item]
+
+    for list_index, ranked in enumerate(ranked_lists):
+        weight = weights[list_index] if weights else 1.0
+        for rank, item in enumerate(ranked): # rank is an index, starts from 0
+            entry = fused.get(key(item))
+            if entry is None:
+                fused[key(item)] = [weight / (k + rank + 1), item]
+            else:
+                entry[0] += weight / (k + rank + 1) # the same item in another list adds to its score
+
+    n = len(fused) if top_k is None else top_k
+    return [(score, item) for score, item in heapq.nlargest(n, fused.values(), key=lambda entry: entry[0])]
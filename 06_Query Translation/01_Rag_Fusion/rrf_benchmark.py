@@ -0,0 +1,68 @@
+import time
+import random
+import argparse
+from collections import defaultdict
+from retrieve import fuse_rankings
+
+# Micro-benchmark: the old triple-loop RRF rebuild vs fuse_rankings (one pass + heap top-k) on synthetic result lists.
+# python rrf_benchmark.py
+# python rrf_benchmark.py --sizes 10x50 50x200 --top-k 20
+
+# The previous reciprocal_rank_fusion body, kept here as the baseline
+def legacy_fusion(lists_of_chunks, k=60):
+    scores = defaultdict(float)
+    for chunk_list in lists_of_chunks:
+        for rank, chunk in enumerate(chunk_list):
+            scores[chunk["content"]] += 1 / (k + rank + 1)
+
+    ranked_chunks = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+    final_chunks = []
+    seen = set()
+    for content, _ in ranked_chunks:
+        for chunk_list in lists_of_chunks:
+            for chunk in chunk_list:
+                if chunk["content"] == content and content not in seen:
+                    final_chunks.append(chunk)
+                    seen.add(content)
+                    break
+    return final_chunks
+
+# n_queries lists of n_chunks results drawn from a pool of ~1000-character chunks, so lists overlap like real fan-out results
+def make_lists(n_queries, n_chunks, seed=0):
+    rng = random.Random(seed)
+    pool = [
+        {"content": f"chunk {i} " + " ".join(rng.choice("abcdefghij") * 5 for _ in range(160)), "page_num": i % 300, "total_pages": 300}
+        for i in range(n_chunks * 3)
+    ]
+    return [[dict(chunk) for chunk in rng.sample(pool, n_chunks)] for _ in range(n_queries)]
+
+def best_time(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reciprocal rank fusion implementations")
+    parser.add_argument("--sizes", nargs="+", default=["3x10", "5x50", "10x100", "25x200", "50x200"], help="<queries>x<chunks per query>")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'queries x chunks':<18}{'legacy':>12}{'fuse (all)':>14}{f'fuse (top {args.top_k})':>16}{'speedup':>10}")
+    for size in args.sizes:
+        n_queries, n_chunks = (int(part) for part in size.split("x"))
+        lists_of_chunks = make_lists(n_queries, n_chunks)
+
+        legacy = legacy_fusion(lists_of_chunks)
+        fused = fuse_rankings(lists_of_chunks)
+        assert [c["content"] for c in fused] == [c["content"] for c in legacy], "fused ranking differs from the legacy one"
+
+        legacy_seconds = best_time(lambda: legacy_fusion(lists_of_chunks), args.repeat)
+        fused_seconds = best_time(lambda: fuse_rankings(lists_of_chunks), args.repeat)
+        top_k_seconds = best_time(lambda: fuse_rankings(lists_of_chunks, top_k=args.top_k), args.repeat)
+        print(f"{size:<18}{legacy_seconds * 1000:>10.2f}ms{fused_seconds * 1000:>12.2f}ms{top_k_seconds * 1000:>14.2f}ms"
+              f"{legacy_seconds / fused_seconds:>9.0f}x")
@@ -0,0 +1,185 @@
+import os
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from qdrant_client import QdrantClient, AsyncQdrantClient, models
+from local_index import LocalVectorIndex
+
+# Vector store backends used by ingest.py and retrieve.py - both expose the same small interface:
+#   ensure_collection(dim), upsert(ids, vectors, payloads), barrier(), delete(ids),
+#   search(vector, k) / search_batch(vectors, k) -> [{ "id", "score", "payload" }, ...], get_vectors(ids), points(), close()
+#   asearch / asearch_batch / aget_vectors -> async versions for event-loop callers (retrieve.py's async path)
+# Pick one with the VECTOR_BACKEND environment variable:
+#   qdrant     -> Qdrant server at QDRANT_URL (default http://localhost:6333)
+#   local      -> LocalVectorIndex, NumPy brute force over memory-mapped vectors (no services needed)
+#   local-hnsw -> LocalVectorIndex with an HNSW graph for larger collections (pip install hnswlib)
+# LOCAL_INDEX_DTYPE=float16 halves the size of local indexes.
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+
+# One client (and its HTTP connection pool) per Qdrant URL for the whole process - QdrantClient is thread-safe
+@lru_cache(maxsize=None)
+def qdrant_client(url=QDRANT_URL):
+    return QdrantClient(url=url)
+
+# Async client for the async retrieval path - its connection pool belongs to the event loop that first uses it,
+# so one process runs one event loop (asyncio.run(main()) in the scripts)
+@lru_cache(maxsize=None)
+def async_qdrant_client(url=QDRANT_URL):
+    return AsyncQdrantClient(url=url)
+
+class QdrantBackend:
+    def __init__(self, collection_name, url=QDRANT_URL, upsert_workers=4, batch_size=64):
+        self.collection_name = collection_name
+        self.url = url
+        self.client = qdrant_client(url)
+        self.batch_size = batch_size
+        self.upsert_workers = upsert_workers
+        self._pool = None
+        self._last_batch = []
+        self._collection_ready = False
+
+    def ensure_collection(self, dim):
+        if self._collection_ready or self.client.collection_exists(self.collection_name):
+            self._collection_ready = True
+            return
+        try:
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE) # same as QdrantVectorStore
+            )
+        except Exception:
+            if not self.client.collection_exists(self.collection_name): # another ingestor may have created it first
+                raise
+        self._collection_ready = True
+
+    # Bulk upsert - batches are sent in parallel with wait=False (Qdrant only acknowledges them into its WAL)
+    def upsert(self, ids, vectors, payloads):
+        if not ids:
+            return
+        self.ensure_collection(len(vectors[0]))
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.upsert_workers)
+
+        points = [
+            models.PointStruct(id=point_id, vector=vector, payload=payload)
+            for point_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        batches = [points[i:i + self.batch_size] for i in range(0, len(points), self.batch_size)]
+        futures = [
+            self._pool.submit(self.client.upsert, collection_name=self.collection_name, points=batch, wait=False)
+            for batch in batches
+        ]
+        for future in futures:
+            future.result() # surface upload errors
+        self._last_batch = batches[-1]
+
+    # Consistency barrier - Qdrant applies the updates of a collection in order, so once an idempotent
+    # re-upsert of the last batch with wait=True returns, every earlier wait=False batch is applied too
+    def barrier(self):
+        if self._last_batch:
+            self.client.upsert(collection_name=self.collection_name, points=self._last_batch, wait=True)
+            self._last_batch = []
+
+    def delete(self, ids):
+        if ids:
+            self.client.delete(collection_name=self.collection_name, points_selector=models.PointIdsList(points=ids), wait=True)
+
+    def search(self, vector, k, with_vectors=False):
+        response = self.client.query_points(
+            collection_name=self.collection_name,
+            query=[float(value) for value in vector],
+            limit=k,
+            with_payload=True,
+            with_vectors=with_vectors,
+        )
+        return [self._hit(point, with_vectors) for point in response.points]
+
+    @staticmethod
+    def _query_requests(vectors, k, with_vectors):
+        return [
+            models.QueryRequest(query=[float(value) for value in vector], limit=k, with_payload=True, with_vector=with_vectors)
+            for vector in vectors
+        ]
+
+    # All queries in one request - Qdrant runs them together and returns one result list per query
+    def search_batch(self, vectors, k, with_vectors=False):
+        if len(vectors) == 0:
+            return []
+        responses = self.client.query_batch_points(
+            collection_name=self.collection_name, requests=self._query_requests(vectors, k, with_vectors)
+        )
+        return [[self._hit(point, with_vectors) for point in response.points] for response in responses]
+
+    # Same batch search awaited on the event loop (AsyncQdrantClient) - no thread per in-flight query
+    async def asearch_batch(self, vectors, k, with_vectors=False):
+        if len(vectors) == 0:
+            return []
+        responses = await async_qdrant_client(self.url).query_batch_points(
+            collection_name=self.collection_name, requests=self._query_requests(vectors, k, with_vectors)
+        )
+        return [[self._hit(point, with_vectors) for point in response.points] for response in responses]
+
+    async def asearch(self, vector, k, with_vectors=False):
+        return (await self.asearch_batch([vector], k, with_vectors))[0]
+
+    # { id: vector } of the given points (ids that no longer exist are left out)
+    def get_vectors(self, ids):
+        points = self.client.retrieve(collection_name=self.collection_name, ids=list(ids), with_payload=False, with_vectors=True)
+        return {str(point.id): point.vector for point in points}
+
+    async def aget_vectors(self, ids):
+        points = await async_qdrant_client(self.url).retrieve(
+            collection_name=self.collection_name, ids=list(ids), with_payload=False, with_vectors=True
+        )
+        return {str(point.id): point.vector for point in points}
+
+    # [(id, payload), ...] of every point (scrolls through the whole collection)
+    def points(self):
+        points, offset = [], None
+        while True:
+            batch, offset = self.client.scroll(
+                collection_name=self.collection_name, limit=1000, offset=offset, with_payload=True, with_vectors=False
+            )
+            points.extend((str(point.id), point.payload or {}) for point in batch)
+            if offset is None:
+                return points
+
+    @staticmethod
+    def _hit(point, with_vectors):
+        hit = {"id": str(point.id), "score": point.score, "payload": point.payload or {}}
+        if with_vectors:
+            hit["vector"] = point.vector
+        return hit
+
+    # Releases the upsert threads only - the pooled client stays open for the other users of this collection
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+# Process-wide registry - one backend per (backend, url, collection), shared by every call and thread,
+# so retrieval no longer builds a new client + connection (and fetches collection info) for every query
+_backends = {}
+_backends_lock = threading.Lock()
+
+# upsert_workers / batch_size (ingestion only) apply to Qdrant - local upserts are a single file append
+def get_vector_backend(collection_name, backend=None, upsert_workers=None, batch_size=None):
+    backend = backend or os.getenv("VECTOR_BACKEND", "qdrant")
+    if backend not in ("qdrant", "local", "local-hnsw"):
+        raise ValueError(f"Unknown vector backend '{backend}' (expected qdrant, local or local-hnsw)")
+
+    key = (backend, QDRANT_URL if backend == "qdrant" else None, collection_name)
+    with _backends_lock:
+        store = _backends.get(key)
+        if store is None:
+            if backend == "qdrant":
+                store = QdrantBackend(collection_name)
+            else:
+                store = LocalVectorIndex(collection_name, dtype=os.getenv("LOCAL_INDEX_DTYPE", "float32"), hnsw=backend == "local-hnsw")
+            _backends[key] = store
+
+    if backend == "qdrant":
+        store.upsert_workers = upsert_workers or store.upsert_workers
+        store.batch_size = batch_size or store.batch_size
+    return store
@@ -7,15 +7,23 @@
 #           query + previous query's chunk -> query + previous query's chunk -> ...
 #           it means, append the previous query's context (chunk) to the next query run
 # 4. Synthesize final answer based on all retrieved chunks
+# execution_mode "map_reduce" runs step 3 concurrently instead (map), only chaining the sub-queries the LLM marks
+# as dependent, and the final answer is the single reduce step
 
 # Import Packages
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 import json
+import time
+import atexit
+import asyncio
+import statistics
+import tiktoken
 from google import genai
 from google.genai import types
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from gemini_embeddings import GeminiEmbeddings
+from embedding_cache import CachedEmbeddings
 import ingest
 import retrieve
 
@@ -28,11 +36,13 @@ client = genai.Client(
     api_key=api_key,
 )
 
-# Embedder - Embedding Model
-embedding = GoogleGenerativeAIEmbeddings(
+# Embedder - Embedding Model (wrapped in a persistent on-disk cache shared by ingestion and retrieval)
+embedding = CachedEmbeddings(GeminiEmbeddings(
     model="models/text-embedding-004",
     google_api_key=api_key,
-)
+))
+atexit.register(embedding.report) # print cache hits/misses when the script exits
+atexit.register(retrieve.retrieval_cache.report) # print retrieval cache hits/misses too
 
 # Ingestion
 pdf_path = Path(__file__).parent / "../data/Atomic Habits.pdf"
@@ -50,6 +60,39 @@ n_queries = 3 # number of queries to generate (default)
 max_chunks = 10 # number of chunks to retrieve for each query from DB
 generated_queries = [] # to store all generated queries
 
+# How the sub-queries are executed:
+#   sequential -> one after another, every sub-query carries the digest of all previous summaries (2 serial round trips per sub-query)
+#   map_reduce -> independent sub-queries are retrieved + summarized concurrently, a sub-query waits only for
+#                 the ones it depends on ("depends_on" from the LLM) and carries only their summaries
+execution_mode = "map_reduce"
+sub_query_timings = {"sequential": [], "map_reduce": []} # seconds per turn, compared when the script exits
+
+def report_timings():
+    for mode, seconds in sub_query_timings.items():
+        if seconds:
+            print(f"⏱️ {mode}: {len(seconds)} turns, median {statistics.median(seconds):.2f}s for retrieval + summaries")
+atexit.register(report_timings)
+
+# Enriched queries carry a rolling digest of earlier summaries instead of all of them: newest summary first,
+# each one trimmed, capped at digest_tokens in total - so the text that gets embedded for retrieval stays the
+# same size however many sub-queries came before (and below the embedding model's input limit).
+# tiktoken is OpenAI's tokenizer, so for Gemini the cap is a close estimate.
+digest_tokens = 400
+encoding = tiktoken.get_encoding("o200k_base")
+
+def summaries_digest(summaries, max_tokens=digest_tokens):
+    parts = []
+    used = 0
+    for summary in reversed(summaries):
+        if not summary:
+            continue
+        tokens = encoding.encode(summary, disallowed_special=())[:min(max_tokens // 2, max_tokens - used)]
+        parts.append(encoding.decode(tokens))
+        used += len(tokens)
+        if used >= max_tokens:
+            break
+    return "\n".join(reversed(parts))
+
 system_instructions = f"""
 <goal>
 You are an intelligent AI assistant specialized in extracting and synthesizing information from a provided PDF titled '{pdf_name}'.
@@ -75,6 +118,7 @@ Your output should help the system retrieve diverse and complete information fro
 1. If the user’s query is ambiguous or unclear, start with step = "think" or "ask".
 2. If the query is answerable, proceed to step = "generated_queries" and create {n_queries} sub-questions + include the user's original query as the final one.
 3. Ensure the sub-questions are ordered logically from fundamental → specific.
+   In "depends_on" give, for every query, the indexes (0-based) of the earlier queries whose answers it needs; [] if it can be answered on its own.
 4. Avoid generating redundant or overlapping sub-questions. Each should expand the conceptual understanding of the topic.
 5. Do not fabricate content; always base reasoning and answers on chunks retrieved from the PDF.
 6. If no relevant chunks are retrieved for a given sub-query, report that clearly in the final answer step.
@@ -91,7 +135,7 @@ Do not treat the user's query as a list of keywords. Think like a tutor guiding
 <output>
 {{ "step": "think", "content": "describe your thinking about the query" }}
 {{ "step": "ask", "content": "clarifying question if needed" }}
-{{ "step": "generated_queries", "queries": ["query1", "query2", "query3", ...], "original_query": "user's original query" }}
+{{ "step": "generated_queries", "queries": ["query1", "query2", "query3", ...], "depends_on": [[], [0], [], ...], "original_query": "user's original query" }}
 {{ "step": "final_answer", "answer": "Your final synthesized response" }}
 </output>
 
@@ -111,7 +155,7 @@ Do not treat the user's query as a list of keywords. Think like a tutor guiding
 Example: 
 User Query -> What is Machine Learning?
 Assistant -> {{ "step": "think", "content": "Query is complete and not ambiguous, so I should generate queries." }}
-Assistant -> {{ "step": "generated_queries", "queries": ["What is Machine?", "What is "Learning?"], "original_query": "What is Machine Learning?" }}
+Assistant -> {{ "step": "generated_queries", "queries": ["What is Machine?", "What is "Learning?", "What is Machine Learning?"], "depends_on": [[], [], [0, 1]], "original_query": "What is Machine Learning?" }}
 Now, system will retrieve chunks and give answer for all queries to you
 User -> {{ "all_query_answers": "you'll get summary with all the queries", "user_original_query": "What is Machine Learning?" }}
 Assistant -> {{ "step": "final_answer", "answer": "Your final answer by reviewing all_query_answers and user_original_query" }}
@@ -162,12 +206,107 @@ def send_to_llm(system_prompt, input_context):
 
     return response
 
-def main():
+# Same request awaited on the event loop (client.aio)
+async def async_send_to_llm(system_prompt, input_context):
+    return await client.aio.models.generate_content(
+        model = "gemini-2.0-flash",
+        config = types.GenerateContentConfig(
+            system_instruction = system_prompt,
+            response_mime_type = "application/json",
+        ),
+        contents = input_context
+    )
+
+# Summarizer input for one sub-query and its chunks
+def summary_request(query, chunks):
+    input_for_summarizer = json.dumps({
+        "step": "summarize",
+        "instruction": "For the given query there're fetched relevant chunks. Use those chunks and make a summarized answer for the query by using the chunks. ",
+        "query": query,
+        "chunks": chunks
+    })
+    return [types.Content(role="user", parts=[types.Part.from_text(text = input_for_summarizer)])]
+
+def parse_summary(summary_response):
+    try:
+        return json.loads(summary_response.text)["summary"].strip()
+    except Exception:
+        return ""
+
+# Original execution - each sub-query is enriched with (a digest of) all previous summaries, so everything runs one after another
+def sequential_sub_queries(queries):
+    summary_of_chunks = {} # Format: { generated_query: summary of chunks }
+
+    # Retrieve chunks for each query and generate summary of it
+    for index, generated_query in enumerate(queries):
+        # Format generated_query to add previous query's retrieved chunk summary
+        enriched_query = ""
+        if index == 0:
+            enriched_query = generated_query
+        else:
+            prev_summary = summaries_digest(list(summary_of_chunks.values()))
+            enriched_query = f"{generated_query}\nPrevious summaries:\n{prev_summary}"
+
+        print("Enriched query: ", enriched_query)
+
+        # Retrieve chunks for enriched_query = current query + prev query's summary
+        retrieved_query_chunks = retrieve.retrieve_relevant_chunks(enriched_query, max_chunks, embedding, collection_name, score_threshold = 0.7)
+
+        # Generated summary - stored as { query: summary }
+        summary_response = send_to_llm(summary_instructions, summary_request(generated_query, retrieved_query_chunks))
+        summary_of_chunks[generated_query] = parse_summary(summary_response)
+
+    return summary_of_chunks
+
+# Group sub-queries into levels: a query runs one level after the deepest query it depends on.
+# Only earlier queries count as dependencies (anything else the LLM returns is ignored), so there are no cycles.
+def dependency_levels(n_queries, depends_on):
+    dependencies = []
+    levels = []
+    level_of = []
+    for index in range(n_queries):
+        marked = depends_on[index] if index < len(depends_on) and isinstance(depends_on[index], list) else []
+        deps = sorted({dep for dep in marked if isinstance(dep, int) and 0 <= dep < index})
+        level = max((level_of[dep] + 1 for dep in deps), default=0)
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(index)
+        level_of.append(level)
+        dependencies.append(deps)
+    return levels, dependencies
+
+# Map - retrieval + summary of one sub-query, enriched only with the summaries of the queries it depends on
+async def map_sub_query(query, dependency_summaries):
+    enriched_query = query
+    if dependency_summaries:
+        enriched_query = f"{query}\nPrevious summaries:\n{summaries_digest(dependency_summaries)}"
+    print("Enriched query: ", enriched_query)
+
+    chunks = await asyncio.to_thread(retrieve.retrieve_relevant_chunks, enriched_query, max_chunks, embedding, collection_name, score_threshold = 0.7)
+    summary_response = await async_send_to_llm(summary_instructions, summary_request(query, chunks))
+    return parse_summary(summary_response)
+
+# Every level runs concurrently - independent sub-queries cost one retrieval + one summary round trip in total
+async def map_sub_queries(queries, depends_on):
+    levels, dependencies = dependency_levels(len(queries), depends_on)
+    print(f"🗺️ Map: {len(queries)} sub-queries in {len(levels)} level(s)\n")
+
+    summaries = [""] * len(queries)
+    for level in levels:
+        level_summaries = await asyncio.gather(*(
+            map_sub_query(queries[index], [summaries[dep] for dep in dependencies[index]]) for index in level
+        ))
+        for index, summary in zip(level, level_summaries):
+            summaries[index] = summary
+
+    return dict(zip(queries, summaries)) # { generated_query: summary of chunks }
+
+async def main():
     while True:
         user_input("Ask anything on your PDF -> ")
 
         while True:
-            response = send_to_llm(system_instructions, contents)
+            response = await async_send_to_llm(system_instructions, contents)
 
             # Parse and Append the response get from LLM
             try:
@@ -209,53 +348,17 @@ def main():
 
                 generated_queries.extend(queries) # extend - takes every item from queries and appends it to generated_queries
 
-                retrieved_chunks = [] # [[{}, {}, ...], [], [], ...]
-                summary_of_chunks = {} # Format: { generated_query: summary of chunks }
-                
-                # Retrieve chunks for each query and generate summary of it
-                for index, generated_query in enumerate(generated_queries):
-                    # Format generated_query to add previous query's retrieved chunk summary
-                    enriched_query = ""
-                    if index == 0:
-                        enriched_query = generated_query
-                    else:
-                        prev_summary = ""
-                        for prev_q, prev_sum in summary_of_chunks.items():
-                            prev_summary += prev_sum + "\n"
-                        enriched_query = f"{generated_query}\nPrevious summaries:\n{prev_summary}"
-
-                    print("Enriched query: ", enriched_query)
-
-                    # Retrieve chunks for enriched_query = current query + prev query's summary
-                    retrieved_query_chunks = retrieve.retrieve_relevant_chunks(enriched_query, max_chunks, embedding, collection_name, score_threshold = 0.7)
-                    retrieved_chunks.extend(retrieved_query_chunks)
-
-                    input_for_summarizer = json.dumps({
-                        "step": "summarize",
-                        "instruction": "For the given query there're fetched relevant chunks. Use those chunks and make a summarized answer for the query by using the chunks. ",
-                        "query": generated_query,
-                        "chunks": retrieved_query_chunks
-                        # "prev_summary": summary_of_chunks # if you want to give previous summary {..., query: summary, ...} then you can. But here I thought we don't need to send it as we're retrieving documents based on summary so it'll have a context of all previous summary 
-                    })
-
-                    summary_context = []
-                    summary_context.append(
-                        types.Content(
-                                role="user",
-                                parts=[types.Part.from_text(text = input_for_summarizer)]
-                        )
-                    )
-                    
-                    # Generated summary
-                    summary_response = send_to_llm(summary_instructions, summary_context)
-                    parsed_summary_response = json.loads(summary_response.text)
-
-                    # Store the summary into summary_of_chunks dictionary as { query: summary }
-                    try:
-                        summary_of_chunks[generated_query] = parsed_summary_response["summary"].strip()
-                    except Exception:
-                        summary_of_chunks[generated_query] = ""
-
+                started = time.perf_counter()
+                if execution_mode == "map_reduce":
+                    summary_of_chunks = await map_sub_queries(generated_queries, parsed_response.get("depends_on") or [])
+                else:
+                    summary_of_chunks = sequential_sub_queries(generated_queries)
+                seconds = time.perf_counter() - started
+                sub_query_timings[execution_mode].append(seconds)
+                print(f"⏱️ {execution_mode}: {len(generated_queries)} sub-queries retrieved + summarized in {seconds:.2f}s\n")
+                generated_queries.clear() # clear the list
+
+                # Reduce - one call with every summary
                 # Send user's original query and all the generated query answers to the LLM with our main context i.e. 'contents'
                 contents.append(
                     types.Content(
@@ -274,4 +377,4 @@ def main():
                 break
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -12,9 +12,11 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 import json
+import atexit
 from google import genai
 from google.genai import types
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from gemini_embeddings import GeminiEmbeddings
+from embedding_cache import CachedEmbeddings
 import ingest
 import retrieve
 
@@ -27,11 +29,13 @@ client = genai.Client(
     api_key=api_key,
 )
 
-# Embedder - Embedding Model
-embedding = GoogleGenerativeAIEmbeddings(
+# Embedder - Embedding Model (wrapped in a persistent on-disk cache shared by ingestion and retrieval)
+embedding = CachedEmbeddings(GeminiEmbeddings(
     model="models/text-embedding-004",
     google_api_key=api_key,
-)
+))
+atexit.register(embedding.report) # print cache hits/misses when the script exits
+atexit.register(retrieve.retrieval_cache.report) # print retrieval cache hits/misses too
 
 # Ingestion
 pdf_path = Path(__file__).parent / "../data/Atomic Habits.pdf"
@@ -0,0 +1,184 @@
+import time
+import asyncio
+import inspect
+import sqlite3
+import hashlib
+import threading
+from array import array
+from pathlib import Path
+from langchain_core.embeddings import Embeddings
+
+# Embed many queries with one batched request instead of one embed_query call per query.
+# Gemini embeds queries with task_type RETRIEVAL_QUERY (embed_documents defaults to RETRIEVAL_DOCUMENT),
+# so the batch is sent with that task type whenever the model supports it.
+def embed_queries(embedding, queries):
+    if not queries:
+        return []
+    if hasattr(embedding, "embed_queries"):
+        return embedding.embed_queries(queries)
+    if "task_type" in inspect.signature(embedding.embed_documents).parameters:
+        return embedding.embed_documents(queries, task_type="RETRIEVAL_QUERY")
+    return embedding.embed_documents(queries)
+
+# Async twin of embed_queries. Models with a native async batch (GeminiEmbeddings in gemini_embeddings.py) are awaited
+# directly; otherwise aembed_documents can't be used - the base one has no task_type, so queries would be embedded as
+# RETRIEVAL_DOCUMENT - and embed_queries runs in a worker thread instead.
+async def aembed_queries(embedding, queries):
+    if not queries:
+        return []
+    if hasattr(embedding, "aembed_queries"):
+        return await embedding.aembed_queries(queries)
+    return await asyncio.to_thread(embed_queries, embedding, queries)
+
+# Persistent embedding cache - wraps any LangChain Embeddings object.
+# Vectors are stored as float32 blobs in SQLite keyed by (model, kind, sha256(text)),
+# the least recently used rows are evicted once the cache holds more than max_entries.
+# 'kind' is "document" or "query" because some models (e.g. Gemini) embed them differently.
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embedding, cache_path=None, max_entries=100_000):
+        self.embedding = embedding
+        self.model = getattr(embedding, "model", None) or type(embedding).__name__
+        self.max_entries = max_entries
+        self.cache_path = Path(cache_path or Path(__file__).parent / "embedding_cache.db")
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, kind, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0 # time spent waiting for the wrapped model
+
+    @staticmethod
+    def _hash(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, kind, hashes):
+        found = {}
+        unique = list(set(hashes))
+        with self._lock:
+            for i in range(0, len(unique), 500): # stay under SQLite's bound-parameter limit
+                part = unique[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND kind = ? AND text_hash IN ({placeholders})",
+                    [self.model, kind, *part]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND kind = ? AND text_hash = ?",
+                    [(time.time(), self.model, kind, text_hash) for text_hash in found]
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, kind, hashes, vectors):
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, kind, text_hash, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                [(self.model, kind, text_hash, array("f", vector).tobytes(), now) for text_hash, vector in zip(hashes, vectors)]
+            )
+            self._count += self._conn.total_changes - before
+
+            # Size-bounded eviction - drop the least recently used rows
+            if self._count > self.max_entries:
+                overflow = self._count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,)
+                )
+                self._count -= overflow
+            self._conn.commit()
+
+    # Split texts into cached vectors and the texts that still have to be embedded
+    def _prepare(self, kind, texts):
+        hashes = [self._hash(text) for text in texts]
+        found = self._lookup(kind, hashes)
+
+        missing = {} # text_hash -> text (duplicates inside one call are embedded once)
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in found:
+                missing.setdefault(text_hash, text)
+
+        self.hits += len(texts) - sum(1 for text_hash in hashes if text_hash not in found)
+        self.misses += len(missing)
+        return hashes, found, missing
+
+    def _finish(self, kind, hashes, found, missing, vectors, started):
+        self.miss_seconds += time.perf_counter() - started
+        self._store(kind, list(missing), vectors)
+        found.update(zip(missing, vectors))
+        return [found[text_hash] for text_hash in hashes]
+
+    def embed_documents(self, texts):
+        hashes, found, missing = self._prepare("document", texts)
+        started = time.perf_counter()
+        vectors = self.embedding.embed_documents(list(missing.values())) if missing else []
+        return self._finish("document", hashes, found, missing, vectors, started)
+
+    async def aembed_documents(self, texts):
+        hashes, found, missing = self._prepare("document", texts)
+        started = time.perf_counter()
+        vectors = await self.embedding.aembed_documents(list(missing.values())) if missing else []
+        return self._finish("document", hashes, found, missing, vectors, started)
+
+    def embed_query(self, text):
+        hashes, found, missing = self._prepare("query", [text])
+        started = time.perf_counter()
+        vectors = [self.embedding.embed_query(text)] if missing else []
+        return self._finish("query", hashes, found, missing, vectors, started)[0]
+
+    # Cached under "query" like embed_query, all misses go out in one batch
+    def embed_queries(self, texts):
+        hashes, found, missing = self._prepare("query", texts)
+        started = time.perf_counter()
+        vectors = embed_queries(self.embedding, list(missing.values())) if missing else []
+        return self._finish("query", hashes, found, missing, vectors, started)
+
+    async def aembed_queries(self, texts):
+        hashes, found, missing = self._prepare("query", texts)
+        started = time.perf_counter()
+        vectors = await aembed_queries(self.embedding, list(missing.values())) if missing else []
+        return self._finish("query", hashes, found, missing, vectors, started)
+
+    async def aembed_query(self, text):
+        hashes, found, missing = self._prepare("query", [text])
+        started = time.perf_counter()
+        vectors = [await self.embedding.aembed_query(text)] if missing else []
+        return self._finish("query", hashes, found, missing, vectors, started)[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        seconds_per_text = self.miss_seconds / self.misses if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "api_texts_saved": self.hits,
+            "estimated_seconds_saved": self.hits * seconds_per_text,
+            "entries": self._count,
+        }
+
+    def report(self):
+        s = self.stats()
+        print(f"🗄️ Embedding cache: {s['hits']} hits / {s['misses']} misses ({s['hit_ratio']:.0%} hit ratio), "
+              f"~{s['estimated_seconds_saved']:.1f}s of embedding latency saved, {s['entries']} cached vectors")
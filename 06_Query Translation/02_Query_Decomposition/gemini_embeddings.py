@@ -0,0 +1,33 @@
+import asyncio
+from google import genai
+from google.genai import types
+from pydantic import PrivateAttr
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+# GoogleGenerativeAIEmbeddings with native async query embedding.
+# The inherited aembed_query / aembed_documents only run the sync calls in a worker thread, so every query miss on
+# the async retrieval path would hold a thread for a whole round-trip. Here they go through the google-genai async
+# client (client.aio) as batched embed_content requests with task_type RETRIEVAL_QUERY, like embed_query.
+# Document embedding (ingestion) is unchanged.
+class GeminiEmbeddings(GoogleGenerativeAIEmbeddings):
+    _aio_client = PrivateAttr(default=None)
+
+    def _async_models(self):
+        if self._aio_client is None:
+            api_key = self.google_api_key.get_secret_value() if self.google_api_key else None
+            self._aio_client = genai.Client(api_key=api_key).aio
+        return self._aio_client.models
+
+    # Picked up by embedding_cache.aembed_queries - all queries in as few requests as the batch limits allow
+    async def aembed_queries(self, texts):
+        if not texts:
+            return []
+        config = types.EmbedContentConfig(task_type="RETRIEVAL_QUERY")
+        responses = await asyncio.gather(*(
+            self._async_models().embed_content(model=self.model, contents=batch, config=config)
+            for batch in self._prepare_batches(texts, 100) # same request limits as embed_documents
+        ))
+        return [embedding.values for response in responses for embedding in response.embeddings]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_queries([text]))[0]
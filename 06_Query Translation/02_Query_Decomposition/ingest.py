@@ -1,54 +1,288 @@
-import re
-import random
+import sys
+import json
+import time
+import uuid
+import hashlib
 from pathlib import Path
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_qdrant import QdrantVectorStore
+from embedder import ConcurrentEmbedder
+from splitter import TokenOffsetSplitter
+from dedup import NearDuplicateFilter
+from registry import REGISTRY_FILE, open_registry
+from vector_backends import get_vector_backend
+from bm25_index import get_bm25_index
 
-def ingest_pdf_to_qdrant(pdf_path, collection_name, embedding):
-    loader = PyPDFLoader(file_path=pdf_path)
-    docs = loader.load()
+# Peak resident memory (RSS) of this process in MB - None if the platform can't report it
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # macOS reports bytes, Linux reports KB
+    except ImportError:
+        pass
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200
-    )
-    chunks = text_splitter.split_documents(docs)
+    try:
+        import psutil # Windows has no 'resource' module
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+# Hashes
+def sha256_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Deterministic point id - the same chunk always lands on the same point, so retries and concurrent runs are idempotent.
+# The page index is part of it: pages with identical text (blank pages, repeated boilerplate) must not share points.
+def point_id(collection_name, page_key, source_hash, chunk_index):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{collection_name}:{page_key}:{source_hash}:{chunk_index}"))
+
+# Manifest - what is already in the collection: { "file_hash": "...", "pages": { "0": { "hash": page_hash, "chunks": { chunk_hash: [point_id, ...] },
+# "dropped": { chunk_hash: [point id of the chunk it near-duplicates, ...] } } } }
+def manifest_path(collection_name):
+    return Path(__file__).parent / "ingest_manifests" / f"{collection_name}.json"
 
-    vector_store = QdrantVectorStore.from_documents(
-        documents=[],
-        url="http://localhost:6333",
-        collection_name=collection_name,
-        embedding=embedding
+def load_manifest(collection_name):
+    path = manifest_path(collection_name)
+    if not path.exists():
+        return {"file_hash": None, "pages": {}}
+    return json.loads(path.read_text())
+
+def save_manifest(collection_name, manifest):
+    path = manifest_path(collection_name)
+    path.parent.mkdir(exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest))
+    tmp_path.replace(path) # atomic, a crash never leaves a half-written manifest
+
+# ~256 tokens is roughly the old 1000-character chunks, but bounded in tokens instead of characters
+def make_text_splitter():
+    return TokenOffsetSplitter(
+        chunk_tokens=256,
+        overlap_tokens=50
     )
-    vector_store.add_documents(documents=chunks)
-    print("Ingestion complete.")
 
+# Parse + split - yields (page_hash, chunks) for every page of the PDF
+def load_split_pages(pdf_path, streaming=True):
+    loader = PyPDFLoader(file_path=pdf_path)
+    text_splitter = make_text_splitter()
+
+    pages = loader.lazy_load() if streaming else loader.load()
+    for page in pages:
+        yield sha256_text(page.page_content), text_splitter.split_documents([page])
+
+# Process-pool worker for directory ingestion - parses and splits a whole PDF (CPU bound, every worker process has its own GIL)
+def split_pdf(pdf_path):
+    start = time.time()
+    pages = list(load_split_pages(pdf_path))
+    return {"pdf_path": pdf_path, "pages": pages, "started": start, "finished": time.time()}
+
+# Records the outcome in the ingestion registry (complete / failed) so a failed run is retried next time
+def ingest_pdf_to_qdrant(pdf_path, collection_name, embedding, registry_file=REGISTRY_FILE, **kwargs):
+    registry = open_registry(registry_file)
+    try:
+        stats = ingest_pages(pdf_path, collection_name, embedding, on_batch=registry.record_progress, **kwargs)
+    except BaseException as error: # Ctrl-C included
+        registry.mark_failed(collection_name, repr(error))
+        raise
+
+    registry.mark_complete(collection_name)
+    return stats
+
+# split_pages - optional pre-split pages [(page_hash, chunks), ...] (e.g. from split_pdf), otherwise the PDF is parsed here
+def ingest_pages(pdf_path, collection_name, embedding, streaming=True, window_size=None, batch_size=64, workers=4, split_pages=None, upsert_workers=4, on_batch=None, dedup_threshold=0.85, backend=None, bm25=True):
+    # Embed each window with N concurrent workers (retry + backoff on rate limits)
+    # instead of one batch at a time; a window keeps all workers busy
+    embedder = ConcurrentEmbedder(embedding, batch_size=batch_size, workers=workers)
+    window_size = window_size or batch_size * workers
+
+    # Qdrant or the local index (VECTOR_BACKEND) - the collection is created on the first upsert
+    store = get_vector_backend(collection_name, backend, upsert_workers=upsert_workers, batch_size=batch_size)
+    sparse = get_bm25_index(collection_name) if bm25 else None # keyword index for hybrid retrieval, same point ids
+
+    # Incremental ingestion - only pages/chunks whose hash changed since the last run are embedded
+    old_manifest = load_manifest(collection_name)
+    manifest = {"file_hash": file_sha256(pdf_path), "pages": dict(old_manifest["pages"])}
+
+    # Collection ingested before the BM25 index existed - index the chunks that are kept as they are, too
+    backfill = sparse is not None and bool(old_manifest["pages"]) and sparse.count() == 0
+    backfill_ids, backfill_payloads = [], []
+
+    start = time.perf_counter()
+    stats = {"pages": 0, "total_pages": 0, "batches": 0, "pages_skipped": 0, "chunks": 0, "chunks_embedded": 0, "chunks_reused": 0, "chunks_deduped": 0, "points_deleted": 0}
+
+    # Near-duplicate chunks (repeated headers/footers, boilerplate pages, overlap) are dropped before embedding
+    deduper = NearDuplicateFilter(threshold=dedup_threshold) if dedup_threshold else None
+
+    window = [] # new chunks waiting to be embedded + upserted
+    window_keys = [] # (page_key, chunk_hash, point_id) of each chunk in the window
+    window_pages = {} # page key -> { "hash": page_hash, "chunks": {...}, "dropped": {...} } for pages in this window
+    stale_ids = [] # points of changed pages that are no longer needed
+    kept_ids = set() # points of the pages handled so far that stay in the collection
+
+    # A page's dropped near-duplicates are only covered while the chunks they duplicate are still stored -
+    # an unchanged page whose duplicated chunk was deleted (edited page) is processed again, so its text gets indexed
+    def duplicates_covered(old_page):
+        own_ids = {chunk_id for ids in old_page["chunks"].values() for chunk_id in ids}
+        return all(
+            keeper in kept_ids or keeper in own_ids
+            for keepers in old_page.get("dropped", {}).values() for keeper in keepers
+        )
+
+    # Embed + upsert the window, then drop the stale points of its pages and record them in the manifest
+    def flush():
+        nonlocal window, window_keys, window_pages, stale_ids, backfill_ids, backfill_payloads
+        if window:
+            ids = [chunk_id for _, _, chunk_id in window_keys]
+            payloads = [{"page_content": chunk.page_content, "metadata": chunk.metadata} for chunk in window] # same layout as QdrantVectorStore
+            vectors = embedder.embed_documents([chunk.page_content for chunk in window])
+            store.upsert(ids, vectors, payloads)
+            if sparse:
+                sparse.add(ids, payloads)
 
-def should_ingest(pdf_path, registry_file="ingested_pdfs.txt"):
-    registry_file = Path(__file__).parent / registry_file
-    registry_file.touch(exist_ok=True)
+            for page_key, chunk_hash, chunk_id in window_keys:
+                window_pages[page_key]["chunks"].setdefault(chunk_hash, []).append(chunk_id)
+            stats["chunks_embedded"] += len(window)
 
+        if backfill_ids:
+            sparse.add(backfill_ids, backfill_payloads)
+            backfill_ids, backfill_payloads = [], []
+
+        if stale_ids:
+            store.delete(stale_ids)
+            if sparse:
+                sparse.delete(stale_ids)
+            stats["points_deleted"] += len(stale_ids)
+
+        # Checkpoint - every page seen so far is now committed, a restart resumes after it
+        manifest["pages"].update(window_pages)
+        save_manifest(collection_name, manifest)
+        stats["batches"] += 1
+        if on_batch:
+            on_batch(collection_name, stats)
+        window, window_keys, window_pages, stale_ids = [], [], {}, []
+
+    # Streaming: page -> chunks -> embed -> upsert in fixed-size windows.
+    # Only one page and one window of chunks (and their vectors) are alive at a time,
+    # so peak memory stays flat no matter how many pages the PDF has.
+    if split_pages is None:
+        split_pages = load_split_pages(pdf_path, streaming)
+
+    for page_index, (page_hash, page_chunks) in enumerate(split_pages):
+        stats["pages"] += 1
+        page_key = str(page_index)
+        old_page = old_manifest["pages"].get(page_key)
+        if page_chunks:
+            stats["total_pages"] = page_chunks[0].metadata.get("total_pages", stats["total_pages"])
+
+        if old_page and old_page["hash"] == page_hash and duplicates_covered(old_page):
+            stats["pages_skipped"] += 1
+            stats["chunks"] += sum(len(ids) for ids in old_page["chunks"].values())
+            kept_ids.update(chunk_id for ids in old_page["chunks"].values() for chunk_id in ids)
+            stored_ids = {chunk_hash: list(ids) for chunk_hash, ids in old_page["chunks"].items()}
+            for chunk in page_chunks:
+                chunk_hash = sha256_text(chunk.page_content)
+                if not stored_ids.get(chunk_hash):
+                    continue
+                stored_id = stored_ids[chunk_hash].pop()
+                if deduper: # stored chunks still count as "seen" for the near-duplicate check
+                    deduper.add(chunk.page_content, stored_id)
+                if backfill:
+                    chunk.metadata.update({"page_hash": page_hash, "chunk_hash": chunk_hash})
+                    backfill_ids.append(stored_id)
+                    backfill_payloads.append({"page_content": chunk.page_content, "metadata": chunk.metadata})
+            if streaming and len(backfill_ids) >= window_size:
+                flush()
+            continue
+
+        # Changed (or new) page - chunks that already exist with the same text keep their points
+        old_chunks = {chunk_hash: list(ids) for chunk_hash, ids in (old_page or {"chunks": {}})["chunks"].items()}
+        new_page = {"hash": page_hash, "chunks": {}, "dropped": {}}
+
+        for chunk_index, chunk in enumerate(page_chunks):
+            chunk_hash = sha256_text(chunk.page_content)
+            if old_chunks.get(chunk_hash):
+                reused_id = old_chunks[chunk_hash].pop()
+                new_page["chunks"].setdefault(chunk_hash, []).append(reused_id)
+                kept_ids.add(reused_id)
+                stats["chunks_reused"] += 1
+                if deduper:
+                    deduper.add(chunk.page_content, reused_id)
+                if backfill:
+                    chunk.metadata.update({"page_hash": page_hash, "chunk_hash": chunk_hash})
+                    backfill_ids.append(reused_id)
+                    backfill_payloads.append({"page_content": chunk.page_content, "metadata": chunk.metadata})
+                stats["chunks"] += 1
+                continue
+
+            chunk_id = point_id(collection_name, page_key, page_hash, chunk_index)
+            keeper = deduper.find_duplicate(chunk.page_content, chunk_id) if deduper else None
+            if keeper is not None:
+                new_page["dropped"].setdefault(chunk_hash, []).append(keeper) # re-checked once that chunk is gone
+                stats["chunks_deduped"] += 1
+                continue
+
+            chunk.metadata.update({"page_hash": page_hash, "chunk_hash": chunk_hash})
+            window.append(chunk)
+            window_keys.append((page_key, chunk_hash, chunk_id))
+            kept_ids.add(chunk_id)
+            stats["chunks"] += 1
+
+        stale_ids.extend(stale_id for ids in old_chunks.values() for stale_id in ids)
+        window_pages[page_key] = new_page
+
+        if streaming and len(window) >= window_size:
+            flush()
+
+    # Pages that disappeared from the PDF
+    for page_key in list(manifest["pages"]):
+        if int(page_key) >= stats["pages"]:
+            stale_ids.extend(stale_id for ids in manifest["pages"].pop(page_key)["chunks"].values() for stale_id in ids)
+
+    flush()
+    store.barrier()
+    store.close()
+
+    elapsed = time.perf_counter() - start
+    stats.update({
+        "seconds": elapsed,
+        "pages_per_sec": stats["pages"] / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "embedding_batches": embedder.batches,
+        "embedding_retries": embedder.retries,
+    })
+
+    rss = f"{stats['peak_rss_mb']:.1f} MB" if stats["peak_rss_mb"] is not None else "n/a"
+    print(f"Ingestion complete. {stats['pages']} pages ({stats['pages_skipped']} already up to date), {stats['chunks']} chunks "
+          f"({stats['chunks_embedded']} embedded, {stats['chunks_reused']} reused, {stats['chunks_deduped']} near-duplicates skipped (embeddings saved), "
+          f"{stats['points_deleted']} stale points deleted) "
+          f"in {elapsed:.1f}s ({stats['pages_per_sec']:.2f} pages/sec, peak RSS {rss}, "
+          f"{embedder.batches} embedding batches, {embedder.retries} retries)")
+    return stats
+
+
+# Claims the PDF in the ingestion registry - returns (should_ingest, collection_name)
+def should_ingest(pdf_path, registry_file=REGISTRY_FILE):
     pdf_name = pdf_path.name
-    existing_entries = registry_file.read_text().splitlines() # Reads the entire contents of the registry file and splits it into a list of lines.
-
-    for line in existing_entries:
-        if pdf_name in line:
-            collection = line.split(":")[-1].strip()
-            print(f"🟡 Already ingested '{pdf_name}' under collection: {collection}")
-            return False, collection  # Return existing collection name
-
-    # If not found, create a new unique collection name
-    base_name = pdf_path.stem
-    clean_name = re.sub(r'[^a-zA-Z0-9]+', '_', base_name)
-    words = clean_name.split('_')[:3]
-    short_name = '_'.join(words)
-    random_suffix = str(random.randint(1000, 9999))
-    collection_name = f"{short_name}_{random_suffix}"
-
-    # Write to registry
-    with open(registry_file, "a") as f:
-        f.write(f"{pdf_name}:{collection_name}\n")
-
-    print(f"🟢 New file detected. Ingesting '{pdf_name}' as collection: {collection_name}")
+    action, collection_name = open_registry(registry_file).claim(pdf_path, file_sha256(pdf_path))
+
+    if action == "skip":
+        print(f"🟡 Already ingested '{pdf_name}' under collection: {collection_name}")
+        return False, collection_name
+
+    if action == "resume":
+        print(f"🟠 Resuming interrupted ingestion of '{pdf_name}' into collection: {collection_name}")
+        return True, collection_name
+
+    if action == "busy":
+        print(f"🟡 '{pdf_name}' is being ingested by another process into collection: {collection_name}")
+        return False, collection_name
+
+    print(f"🟢 Ingesting '{pdf_name}' as collection: {collection_name}")
     return True, collection_name
@@ -0,0 +1,54 @@
+import numpy as np
+
+# Maximal Marginal Relevance (MMR) - picks a diverse top-k out of the retrieved candidates.
+# With chunk_overlap=200 the nearest chunks are often overlapping neighbours of the same passage;
+# MMR trades relevance for novelty, one pick at a time:
+#   next = argmax  lambda * relevance(chunk) - (1 - lambda) * max similarity(chunk, already picked)
+# lambda_mult=1.0 -> plain relevance order, 0.0 -> maximum diversity.
+
+def _normalize(matrix):
+    matrix = np.array(matrix, dtype=np.float32, ndmin=2) # copy - normalized in place
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return matrix
+
+# Indices of the k candidates picked by MMR, in pick order.
+# query_vectors - one or more queries (fused retrieval): relevance is the best cosine similarity to any of them
+def mmr_select(query_vectors, candidate_vectors, k, lambda_mult=0.5):
+    if not 0.0 <= lambda_mult <= 1.0:
+        raise ValueError(f"lambda_mult must be between 0 and 1, got {lambda_mult}")
+    if len(candidate_vectors) == 0 or k <= 0:
+        return []
+
+    candidates = _normalize(candidate_vectors)
+    relevance = (candidates @ _normalize(query_vectors).T).max(axis=1) # (n_candidates,)
+    similarity = candidates @ candidates.T # (n_candidates x n_candidates) in one pass
+
+    selected = []
+    redundancy = np.zeros(len(candidates), dtype=np.float32) # max similarity to the picked candidates so far
+    available = np.ones(len(candidates), dtype=bool)
+    for _ in range(min(k, len(candidates))):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        redundancy = np.maximum(redundancy, similarity[pick])
+    return selected
+
+# MMR over hits or result dicts ({ "id", ..., optional "vector" }) - returns the picked ones without their vectors.
+# Items without a vector (keyword hits, merged result dicts) get theirs from the vector store by id.
+def mmr_rerank(items, query_vectors, store, k, lambda_mult=0.5):
+    missing = [item["id"] for item in items if item.get("vector") is None and item.get("id")]
+    fetched = store.get_vectors(missing) if missing else {}
+
+    candidates, vectors = [], []
+    for item in items:
+        vector = item.get("vector")
+        if vector is None:
+            vector = fetched.get(item.get("id"))
+        if vector is not None: # gone from the store since it was retrieved (or no id) -> can't be compared
+            candidates.append(item)
+            vectors.append(vector)
+
+    picked = mmr_select(query_vectors, vectors, k, lambda_mult)
+    return [{key: value for key, value in candidates[i].items() if key != "vector"} for i in picked]
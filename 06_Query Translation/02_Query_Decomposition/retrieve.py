@@ -1,32 +1,78 @@
-from langchain_qdrant import QdrantVectorStore
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from vector_backends import get_vector_backend
+from registry import open_registry
+from retrieval_cache import RetrievalCache
+from bm25_index import get_bm25_index, fuse_hits
+from mmr import mmr_rerank
 
-# Retrieve relevant chunks from Qdrant for each query
-def retrieve_relevant_chunks(user_query, max_chunks, embedding, collection_name, score_threshold=0.7):
+# Retrieval mode (RETRIEVAL_MODE environment variable or the 'mode' argument):
+#   dense  -> vector search only
+#   hybrid -> vector search + BM25 keyword search (bm25_index.py) run concurrently and fused with RRF;
+#             the cosine score_threshold applies to the dense hits, "score" of a hybrid result is its fused RRF score
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+_sparse_pool = ThreadPoolExecutor(max_workers=4) # keyword searches run here while the query is embedded
+
+# Process-wide result cache - repeated questions skip both the embedding call and the search
+retrieval_cache = RetrievalCache()
+
+# Bumped by the ingestion registry on every (re-)ingest, so cached results of a re-ingested collection are never served
+def collection_version(collection_name):
+    return open_registry().collection_version(collection_name)
+
+# Retrieve relevant chunks from the vector store for each query
+# mmr_k / mmr_lambda - optional MMR diversity stage (mmr.py): keep mmr_k diverse chunks out of the max_chunks retrieved
+def retrieve_relevant_chunks(user_query, max_chunks, embedding, collection_name, score_threshold=0.7, backend=None, query_vector=None, mode=None,
+                             mmr_k=None, mmr_lambda=0.5):
     if not user_query or not user_query.strip():
         raise ValueError("❌ Cannot embed an empty query for retrieval.")
+
+    mode = mode or RETRIEVAL_MODE
+    if mode not in ("dense", "hybrid"):
+        raise ValueError(f"Unknown retrieval mode '{mode}' (expected dense or hybrid)")
     
-    vector_store = QdrantVectorStore.from_existing_collection(
-        url="http://localhost:6333",
-        collection_name=collection_name,
-        embedding=embedding
-    )
+    cache_mode = mode if mmr_k is None else f"{mode}+mmr:{mmr_k}:{mmr_lambda}"
+    cache_key = retrieval_cache.make_key(collection_name, collection_version(collection_name), user_query, max_chunks, score_threshold, cache_mode)
+    cached = retrieval_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
 
-    # Perform similarity search with the specified number of chunks
-    results = vector_store.similarity_search_with_score(user_query, k=max_chunks)
+    # Qdrant or the local index, picked by VECTOR_BACKEND (see vector_backends.py)
+    store = get_vector_backend(collection_name, backend)
+    sparse_future = _sparse_pool.submit(get_bm25_index(collection_name).search, user_query, max_chunks) if mode == "hybrid" else None
+
+    # Perform similarity search with the specified number of chunks (query_vector - already embedded by the caller)
+    if query_vector is None:
+        query_vector = embedding.embed_query(user_query)
+    results = store.search(query_vector, k=max_chunks, with_vectors=mmr_k is not None)
+
+    if sparse_future:
+        results = fuse_hits([hit for hit in results if hit["score"] >= score_threshold], sparse_future.result(), max_chunks)
+        score_threshold = float("-inf") # already applied to the dense hits
+
+    # Diverse mmr_k out of the candidates that passed the threshold
+    if mmr_k is not None:
+        results = mmr_rerank([hit for hit in results if hit["score"] >= score_threshold], [query_vector], store, mmr_k, mmr_lambda)
 
     final_result = []
 
     # Prepare the final result with content and metadata
-    for result, score in results:
-        if score >= score_threshold:
+    for result in results:
+        metadata = result["payload"].get("metadata") or {}
+        if result["score"] >= score_threshold:
             final_result.append({
-                "content": result.page_content if hasattr(result, 'page_content') else "",
-                "page_num": result.metadata.get("page", ""),
-                "total_pages": result.metadata.get("total_pages", ""),
-                "score": score
+                "id": result["id"], # stable point id from ingestion
+                "content": result["payload"].get("page_content", ""),
+                "page_num": metadata.get("page", ""),
+                "total_pages": metadata.get("total_pages", ""),
+                "score": result["score"]
             })
 
     # print(f"\nQUERY: {user_query} -------- CHUNKS: {final_result}\n\n")
     
+    retrieval_cache.put(cache_key, final_result, time.perf_counter() - started)
+
     # Return the final result containing relevant chunks
     return final_result
\ No newline at end of file
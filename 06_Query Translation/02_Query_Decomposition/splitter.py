@@ -0,0 +1,147 @@
+import time
+import argparse
+import tracemalloc
+import tiktoken
+import numpy as np
+from langchain_core.documents import Document
+
+# Token-aware splitter that works on offsets into the page text.
+# The page is tokenized once with tiktoken; chunk boundaries are picked on token offsets
+# (preferring paragraph > line > sentence > word breaks near the end of each window),
+# and a string is only sliced out of the page for the final chunks.
+# Token offsets come from a per-encoding table of token byte lengths - no decode of the tokens back into text.
+# Note: tiktoken is OpenAI's tokenizer, so for Gemini embeddings the token count is a close estimate, not exact.
+class TokenOffsetSplitter:
+    def __init__(self, chunk_tokens=256, overlap_tokens=50, encoding_name="o200k_base", lookback_tokens=48):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+
+        self.encoding = tiktoken.get_encoding(encoding_name) # o200k_base = gpt-4o encoding (see 01_Introduction/TikToken)
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.lookback_tokens = min(lookback_tokens, chunk_tokens // 2)
+
+    _byte_lengths = {} # encoding name -> byte length of every token id, built once per process
+
+    def _token_byte_lengths(self):
+        lengths = self._byte_lengths.get(self.encoding.name)
+        if lengths is None:
+            lengths = np.zeros(self.encoding.n_vocab, dtype=np.int64)
+            for token in range(self.encoding.n_vocab):
+                try:
+                    lengths[token] = len(self.encoding.decode_single_token_bytes(token))
+                except KeyError: # unused id between the regular and the special tokens
+                    pass
+            self._byte_lengths[self.encoding.name] = lengths
+        return lengths
+
+    # Character where each token starts: cumulative token byte lengths give byte offsets into the UTF-8 page,
+    # and counting the bytes that start a character maps them to characters. A token starting inside a multi-byte
+    # character maps to the start of that character (like tiktoken's decode_with_offsets).
+    def _token_offsets(self, text, tokens):
+        lengths = self._token_byte_lengths()[tokens]
+        byte_starts = np.cumsum(lengths) - lengths
+        raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        char_of_byte = np.cumsum((raw & 0xC0) != 0x80) - 1
+        return char_of_byte[byte_starts].tolist()
+
+    # How good is it to end a chunk right before 'position' (higher is better)
+    @staticmethod
+    def _break_rank(text, position):
+        if text.startswith("\n\n", position):
+            return 4
+        char = text[position]
+        if char == "\n":
+            return 3
+        if char.isspace():
+            return 2 if position and text[position - 1] in ".!?" else 1
+        return 0
+
+    # Returns [(start, end), ...] character offsets of the chunks of 'text'
+    def split_offsets(self, text):
+        tokens = self.encoding.encode(text, disallowed_special=())
+        n_tokens = len(tokens)
+        if not n_tokens:
+            return []
+
+        offsets = self._token_offsets(text, tokens) # offsets[i] = character where token i starts
+        spans = []
+        start_token = 0
+
+        while start_token < n_tokens:
+            end_token = min(start_token + self.chunk_tokens, n_tokens)
+
+            # Pull the end back to the best natural break within the lookback window
+            if end_token < n_tokens:
+                best_token, best_rank = end_token, self._break_rank(text, offsets[end_token])
+                for candidate in range(end_token - 1, max(start_token, end_token - self.lookback_tokens), -1):
+                    rank = self._break_rank(text, offsets[candidate])
+                    if rank > best_rank:
+                        best_token, best_rank = candidate, rank
+                end_token = best_token
+
+            # Trim surrounding whitespace by moving offsets (no intermediate strings)
+            start = offsets[start_token]
+            end = offsets[end_token] if end_token < n_tokens else len(text)
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            if start < end:
+                spans.append((start, end))
+
+            if end_token >= n_tokens:
+                break
+            start_token = max(end_token - self.overlap_tokens, start_token + 1)
+
+        return spans
+
+    def split_text(self, text):
+        return [text[start:end] for start, end in self.split_offsets(text)]
+
+    # Same interface as LangChain's text splitters
+    def split_documents(self, documents):
+        chunks = []
+        for document in documents:
+            text = document.page_content
+            for start, end in self.split_offsets(text):
+                chunks.append(Document(page_content=text[start:end], metadata={**document.metadata, "start_index": start}))
+        return chunks
+
+
+# Benchmark against the current RecursiveCharacterTextSplitter on a PDF:
+# python splitter.py "../data/Reach - Social Media Analytics.pdf"
+if __name__ == "__main__":
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    parser = argparse.ArgumentParser(description="Compare TokenOffsetSplitter with RecursiveCharacterTextSplitter")
+    parser.add_argument("pdf_path")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = PyPDFLoader(file_path=args.pdf_path).load()
+    encoding = tiktoken.get_encoding("o200k_base")
+    splitters = {
+        "RecursiveCharacterTextSplitter(1000, 200)": RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200),
+        "TokenOffsetSplitter(256, 50)": TokenOffsetSplitter(chunk_tokens=256, overlap_tokens=50),
+    }
+
+    print(f"{len(pages)} pages\n")
+    for name, splitter in splitters.items():
+        splitter.split_documents(pages[:1]) # warm up (loads the tiktoken encoding)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            chunks = splitter.split_documents(pages)
+        elapsed = (time.perf_counter() - start) / args.repeat
+
+        tracemalloc.start()
+        splitter.split_documents(pages)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        token_counts = [len(encoding.encode(chunk.page_content, disallowed_special=())) for chunk in chunks]
+        print(f"{name}")
+        print(f"   {elapsed * 1000:.1f} ms per run, {len(pages) / elapsed:.0f} pages/s, peak allocations {peak / 1024:.0f} KB")
+        print(f"   {len(chunks)} chunks, tokens per chunk min {min(token_counts, default=0)} / max {max(token_counts, default=0)}\n")